@@ -3,15 +3,24 @@
 Creates a connectivity matrix and provide methods to get the connectivity
 between two motes.
 
-The connectivity matrix is indexed by source id, destination id and channel offset.
-Each cell of the matrix is a dict with the fields `pdr` and `rssi`
+The connectivity matrix is made of two arrays, one for the PDR and one for the
+RSSI, indexed by source id, destination id and channel offset.
 
-The connectivity matrix can be filled statically at startup or be updated along
-time if a connectivity trace is given.
+When conn_sparse_rssi_floor is set, the connectivity matrix is stored as
+neighbor lists instead: for each source, a dict indexed by destination id of
+the PDRs (first row) and RSSIs (second row) of the link, per channel offset.
+Only the links having an RSSI at or above the floor on at least one channel are
+stored; the others have a PDR of 0 and an RSSI of -1000.
 
-The propagate() method is called at every slot. It loops through the
-transmissions occurring during that slot and checks if the transmission fails or
-succeeds.
+The connectivity matrix can be filled statically at startup or be updated along
+time if a connectivity trace is given. A K7 trace is either the gzipped text
+trace, read forward once by K7TraceReader, or its binary conversion
+(K7_BINARY_EXTENSION) by convert_k7_to_binary(), which is memory-mapped and
+indexed by ASN. The engine updates the matrix at the ASNs of the trace rows.
+
+The propagate() method is called at every slot in which at least one radio is
+on. It loops through the transmissions occurring during that slot and checks if
+the transmission fails or succeeds.
 """
 
 # =========================== imports =========================================
@@ -22,9 +31,14 @@ import math
 from abc import abstractmethod
 import gzip
 from datetime import datetime
+import hashlib
 import json
+import os
+import struct
+import tempfile
+
+import numpy
 
-import SimSettings
 import SimEngine
 from Mote.Mote import Mote
 from Mote import MoteDefines as d
@@ -33,70 +47,207 @@ from Mote import MoteDefines as d
 
 CONN_TYPE_TRACE         = "trace"
 
+# verify, at the end of propagate(), that all the radios are off by scanning
+# all the motes (debug check)
+CHECK_RADIO_STATES      = False
+
+# binary files (K7 traces, random topologies) start with a magic, the length of
+# the JSON header and the JSON header, padded to 8 bytes, followed by arrays
+
+# binary K7 trace: the arrays are the ASN index (the ASNs of the rows, and the
+# index of the first row of each of them plus the number of rows) and the
+# rows sorted by ASN, one per link and channel
+K7_BINARY_EXTENSION     = '.k7.bin'
+K7_BINARY_MAGIC         = 'K7BINARY'
+K7_BINARY_ROW           = numpy.dtype(
+    [
+        ('asn',            '<i8'),
+        ('src',            '<i4'),
+        ('dst',            '<i4'),
+        ('channel',        '<i2'), # offset from the first channel of the trace
+        ('transaction_id', '<i4'),
+        ('pdr',            '<f4'),
+        ('rssi',           '<f4'),
+    ]
+)
+
+# random topology: the arrays are the coordinates of the motes and the lower
+# triangles (row by row) of the symmetric RSSI and PDR matrices
+TOPOLOGY_MAGIC          = 'TOPOLOGY'
+
+# RSSI and PDR relationship obtained by experiment; dataset was available at
+# the link shown below:
+# http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
+RSSI_PDR_TABLE          = {
+    -97:    0.0000,  # this value is not from experiment
+    -96:    0.1494,
+    -95:    0.2340,
+    -94:    0.4071,
+    # <-- 50% PDR is here, at RSSI=-93.6
+    -93:    0.6359,
+    -92:    0.6866,
+    -91:    0.7476,
+    -90:    0.8603,
+    -89:    0.8702,
+    -88:    0.9324,
+    -87:    0.9427,
+    -86:    0.9562,
+    -85:    0.9611,
+    -84:    0.9739,
+    -83:    0.9745,
+    -82:    0.9844,
+    -81:    0.9854,
+    -80:    0.9903,
+    -79:    1.0000,  # this value is not from experiment
+}
+RSSI_PDR_MIN            = min(RSSI_PDR_TABLE.keys())
+RSSI_PDR_MAX            = max(RSSI_PDR_TABLE.keys())
+
+# PDR and slope of the curve at each dB from RSSI_PDR_MIN, indexed by
+# floor(rssi) - RSSI_PDR_MIN; the curve is linear between two table entries
+_RSSI_PDR_LOW           = [
+    RSSI_PDR_TABLE[rssi] for rssi in range(RSSI_PDR_MIN, RSSI_PDR_MAX)
+]
+_RSSI_PDR_SLOPE         = [
+    RSSI_PDR_TABLE[rssi + 1] - RSSI_PDR_TABLE[rssi]
+    for rssi in range(RSSI_PDR_MIN, RSSI_PDR_MAX)
+]
+_RSSI_PDR_LOW_ARRAY     = numpy.array(_RSSI_PDR_LOW)
+_RSSI_PDR_SLOPE_ARRAY   = numpy.array(_RSSI_PDR_SLOPE)
+
 # =========================== helpers =========================================
 
+def _write_binary_file(path, magic, header, arrays):
+    # write to a temporary file renamed at the end, so that concurrent readers
+    # of the path never see a partial file
+    header = json.dumps(header)
+    header += ' ' * (-(len(magic) + 4 + len(header)) % 8)
+
+    (fd, temp_path) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(magic)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for array in arrays:
+            f.write(array.tobytes())
+    os.chmod(temp_path, 0o644)
+    os.rename(temp_path, path)
+
+def _read_binary_header(path, magic):
+    # return the JSON header and the offset of the first array
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError('{0} is not a {1} file'.format(path, magic))
+        (header_length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_length))
+    return (header, len(magic) + 4 + header_length)
+
+def _map_binary_array(path, offset, dtype, shape):
+    # return the memory-mapped array and the offset of the next one
+    array = numpy.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+    return (array, offset + array.nbytes)
+
+def _get_k7_asn(first_date, date, slot_duration):
+    # convert a row datetime to ASN
+    time_delta = date - first_date
+    return int(time_delta.total_seconds() / float(slot_duration))
+
+def convert_k7_to_binary(trace_path, binary_path, slot_duration):
+    """
+    Convert the K7 trace at trace_path (.k7.gz) into a binary trace, for a
+    slot duration in seconds.
+    """
+
+    trace = K7TraceReader(trace_path, slot_duration)
+    rows  = trace.read_until(None)
+    trace.close()
+
+    # sort the rows by ASN, keeping the order of the trace within an ASN
+    rows = numpy.array(rows, dtype=K7_BINARY_ROW)
+    rows = rows[numpy.argsort(rows['asn'], kind='mergesort')]
+    (index_asn, index_start) = numpy.unique(rows['asn'], return_index=True)
+    index_start = numpy.append(index_start, len(rows))
+
+    header = dict(trace.header)
+    header.update(
+        {
+            'slot_duration':    slot_duration,
+            'num_rows':         len(rows),
+            'num_asns':         len(index_asn),
+            'num_initial_rows': int(numpy.count_nonzero(rows['transaction_id'] == 0)),
+        }
+    )
+    _write_binary_file(
+        binary_path,
+        K7_BINARY_MAGIC,
+        header,
+        [index_asn.astype('<i8'), index_start.astype('<i8'), rows]
+    )
+
+def rssi_to_pdr(rssi):
+    """Convert an RSSI (dBm) into a PDR, interpolating RSSI_PDR_TABLE"""
+    if rssi < RSSI_PDR_MIN:
+        return 0.0
+    elif rssi >= RSSI_PDR_MAX:
+        return 1.0
+    else:
+        floor_rssi = int(math.floor(rssi))
+        index      = floor_rssi - RSSI_PDR_MIN
+        # linear interpolation
+        return _RSSI_PDR_SLOPE[index] * (rssi - float(floor_rssi)) + _RSSI_PDR_LOW[index]
+
+def rssi_to_pdr_array(rssis):
+    """Same as rssi_to_pdr(), on an array of RSSIs"""
+    rssis       = numpy.asarray(rssis, dtype=numpy.float64)
+    floor_rssis = numpy.floor(rssis)
+    index       = numpy.clip(
+        floor_rssis - RSSI_PDR_MIN,
+        0,
+        len(_RSSI_PDR_LOW) - 1
+    ).astype(numpy.intp)
+    with numpy.errstate(invalid='ignore'): # infinite RSSIs, replaced below
+        pdrs    = (
+            _RSSI_PDR_SLOPE_ARRAY[index] * (rssis - floor_rssis) +
+            _RSSI_PDR_LOW_ARRAY[index]
+        )
+    pdrs        = numpy.where(rssis < RSSI_PDR_MIN,  0.0, pdrs)
+    pdrs        = numpy.where(rssis >= RSSI_PDR_MAX, 1.0, pdrs)
+    return pdrs
+
 # =========================== classes =========================================
 
 class Connectivity(object):
-    def __new__(cls):
-        settings    = SimEngine.SimSettings.SimSettings()
-        class_name  = 'Connectivity{0}'.format(settings.conn_class)
-        return getattr(sys.modules[__name__], class_name)()
+    def __new__(cls, engine):
+        class_name  = 'Connectivity{0}'.format(engine.settings.conn_class)
+        return getattr(sys.modules[__name__], class_name)(engine)
 
 class ConnectivityBase(object):
 
-    # ===== start singleton
-    _instance = None
-    _init = False
-
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(ConnectivityBase, cls).__new__(cls, *args, **kwargs)
-        return cls._instance
-    # ===== end singleton
-
-    def __init__(self):
-
-        # ==== start singleton
-        cls = type(self)
-        if cls._init:
-            return
-        cls._init = True
-        # ==== end singleton
+    def __init__(self, engine):
 
         # store params
+        self.engine   = engine
 
-        # singletons (quicker access, instead of recreating every time)
-        self.settings = SimSettings.SimSettings()
-        self.engine   = SimEngine.SimEngine()
-        self.log      = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access)
+        self.settings = engine.settings
+        self.log      = engine.log
 
         # local variables
-        self.connectivity_matrix = {} # described at the top of the file
         self.connectivity_matrix_timestamp = 0
+        self.asn_propagate = None # ASN at which propagate() is scheduled
 
-        # at the beginning, connectivity matrix indicates no connectivity at all
-        for source in self.engine.motes:
-            self.connectivity_matrix[source.id] = {}
-            for destination in self.engine.motes:
-                self.connectivity_matrix[source.id][destination.id] = {}
-                for channel in range(self.settings.phy_numChans):
-                    self.connectivity_matrix[source.id][destination.id][channel] = {
-                        "pdr":      0,
-                        "rssi": -1000,
-                    }
+        # ids of the motes transmitting and listening in the current slot,
+        # per channel; maintained by the radios
+        self.transmitters  = [set() for _ in range(self.settings.phy_numChans)]
+        self.listeners     = [set() for _ in range(self.settings.phy_numChans)]
+
+        # connectivity matrix, described at the top of the file
+        self.rssi_floor    = self.settings.conn_sparse_rssi_floor
+        self._clear_connectivity_matrix()
 
         # introduce some connectivity in the matrix
         self._init_connectivity_matrix()
 
-        # schedule propagation task
-        self._schedule_propagate()
-
-    def destroy(self):
-        cls           = type(self)
-        cls._instance = None
-        cls._init     = False
-
     # ======================== abstract =======================================
 
     @abstractmethod
@@ -113,7 +264,13 @@ class ConnectivityBase(object):
         assert type(destination)==int
         assert type(channel)==int
 
-        return self.connectivity_matrix[source][destination][channel]["pdr"]
+        if self.links is None:
+            return float(self.pdr_matrix[source, destination, channel])
+
+        link = self.links[source].get(destination)
+        if link is None:
+            return 0.0
+        return float(link[0, channel])
 
     def get_rssi(self, source, destination, channel):
 
@@ -121,12 +278,36 @@ class ConnectivityBase(object):
         assert type(destination) == int
         assert type(channel) == int
 
-        if "rssi" not in self.connectivity_matrix[source][destination][channel]:
-            pass
-        return self.connectivity_matrix[source][destination][channel]["rssi"]
+        if self.links is None:
+            return float(self.rssi_matrix[source, destination, channel])
+
+        link = self.links[source].get(destination)
+        if link is None:
+            return -1000.0
+        return float(link[1, channel])
 
     # === propagation
 
+    def schedule_propagate(self):
+        '''
+        schedule a propagation task in the current slot, after the radios have
+        been turned on. Called by the radio when it starts a TX or an RX; idle
+        slots are not propagated.
+        '''
+        asn = self.engine.getAsn()
+
+        # schedule only once per slot
+        if self.asn_propagate == asn:
+            return
+        self.asn_propagate = asn
+
+        self.engine.scheduleAtAsn(
+            asn              = asn,
+            cb               = self.propagate,
+            uniqueTag        = (None, 'Connectivity.propagate'),
+            intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
+        )
+
     def propagate(self):
         """ Simulate the propagation of frames in a slot. """
 
@@ -137,54 +318,67 @@ class ConnectivityBase(object):
         # repeat propagation for each channel
         for channel in range(self.settings.phy_numChans):
 
+            # skip channels without radio activity
+            if (not self.transmitters[channel]) and (not self.listeners[channel]):
+                continue
+
             # === accounting
 
             # list all transmissions at that frequency
             alltransmissions = []
-            for mote in self.engine.motes:
-                if mote.radio.onGoingTransmission:
-                    assert mote.radio.state == d.RADIO_STATE_TX
-                    if mote.radio.onGoingTransmission['channel'] == channel:
-                        thisTran = {}
+            for mote_id in sorted(self.transmitters[channel]):
+                mote = self.engine.motes[mote_id]
+                assert mote.radio.state == d.RADIO_STATE_TX
+                assert mote.radio.onGoingTransmission['channel'] == channel
 
-                        # channel
-                        thisTran['channel'] = channel
+                thisTran = {}
 
-                        # packet
-                        thisTran['packet']  = mote.radio.onGoingTransmission['packet']
-                        srcMac              = thisTran['packet']['mac']['srcMac']
-                        srcMote             = self.engine.motes[srcMac]
+                # channel
+                thisTran['channel'] = channel
 
-                        # time at which the packet starts transmitting
-                        thisTran['txTime']  = srcMote.tsch.clock.get_drift()
+                # packet
+                thisTran['packet']  = mote.radio.onGoingTransmission['packet']
+                srcMac              = thisTran['packet']['mac']['srcMac']
+                srcMote             = self.engine.motes[srcMac]
 
-                        # number of ACKs received by this packet
-                        thisTran['numACKs'] = 0
+                # time at which the packet starts transmitting
+                thisTran['txTime']  = srcMote.tsch.clock.get_drift()
 
-                        alltransmissions   += [thisTran]
+                # number of ACKs received by this packet
+                thisTran['numACKs'] = 0
+
+                alltransmissions   += [thisTran]
 
             # === decide which listener gets which packet (rxDone)
 
-            for listener in self._get_listeners(channel):
+            listeners = self._get_listeners(channel)
 
-                # random_value will be used for comparison against PDR
-                random_value = random.random()
+            # PDR and RSSI of each transmission (row) at each listener (column)
+            if alltransmissions and listeners:
+                srcMacs        = [t['packet']['mac']['srcMac'] for t in alltransmissions]
+                txTimes        = numpy.array([t['txTime'] for t in alltransmissions])
+                (pdrs, rssis)  = self._get_links(srcMacs, listeners, channel)
 
-                # list the transmissions that listener can hear
-                transmissions = []
-                for t in alltransmissions:
-                    pdr = self.get_pdr(
-                        source      = t['packet']['mac']['srcMac'],
-                        destination = listener,
-                        channel     = channel,
-                    )
+            # power in mW of each transmission at each listener, converted
+            # once for all the listeners on the first reception
+            rssis_mW = None
 
-                    # you can interpret the following line as decision for
-                    # reception of the preamble of 't'
-                    if random_value < pdr:
-                        transmissions += [t]
+            for (listener_index, listener) in enumerate(listeners):
+
+                # random_value will be used for comparison against PDR; it is
+                # drawn listener after listener, as rxDone() may draw random
+                # values too
+                random_value = self.engine.random.random()
 
-                if transmissions == []:
+                # list the transmissions that listener can hear; you can
+                # interpret the comparison as decision for reception of the
+                # preamble of each transmission
+                if alltransmissions:
+                    audible = numpy.flatnonzero(random_value < pdrs[:, listener_index])
+                else:
+                    audible = []
+
+                if len(audible) == 0:
                     # no transmissions
 
                     # idle listen
@@ -196,14 +390,12 @@ class ConnectivityBase(object):
                     # there are transmissions
 
                     # listener locks onto the earliest transmission
-                    lockon_transmission = None
-                    for t in transmissions:
-                        if lockon_transmission is None or t['txTime']<lockon_transmission['txTime']:
-                            lockon_transmission = t
+                    lockon                    = audible[numpy.argmin(txTimes[audible])]
+                    lockon_transmission       = alltransmissions[lockon]
 
                     # all other transmissions are now intereferers
-                    interfering_transmissions = [t for t in transmissions if t!=lockon_transmission]
-                    assert len(transmissions) == len(interfering_transmissions)+1
+                    interfering               = audible[audible != lockon]
+                    interfering_transmissions = [alltransmissions[i] for i in interfering]
 
                     # log
                     if interfering_transmissions:
@@ -218,10 +410,13 @@ class ConnectivityBase(object):
                         )
 
                     # calculate the resulting pdr when taking interferers into account
+                    if rssis_mW is None:
+                        rssis_mW = numpy.power(10.0, rssis / 10.0)
                     pdr = self._compute_pdr_with_interference(
                         listener                     = listener,
-                        lockon_transmission          = lockon_transmission,
-                        interfering_transmissions    = interfering_transmissions,
+                        lockon_pdr                   = pdrs[lockon, listener_index],
+                        lockon_mW                    = rssis_mW[lockon, listener_index],
+                        interfering_mWs              = rssis_mW[interfering, listener_index],
                     )
 
                     # decide whether listener receives lockon_transmission or not
@@ -253,7 +448,7 @@ class ConnectivityBase(object):
                         assert sentAnAck==False
 
             # verify no more listener on this channel
-            assert self._get_listeners(channel)==[]
+            assert not self.listeners[channel]
 
             # === decide whether transmitters get an ACK (txDone)
 
@@ -272,87 +467,167 @@ class ConnectivityBase(object):
                 self.engine.motes[t['packet']['mac']['srcMac']].radio.txDone(isACKed)
 
             # verify no more radios active on this channel
-            for mote in self.engine.motes:
-                assert mote.radio.channel != channel
+            assert not self.transmitters[channel]
 
         # verify all radios off
-        for mote in self.engine.motes:
-            assert mote.radio.state == d.RADIO_STATE_OFF
-            assert mote.radio.channel == None
-
-        # schedule next propagation
-        self._schedule_propagate()
+        if CHECK_RADIO_STATES:
+            for mote in self.engine.motes:
+                assert mote.radio.state == d.RADIO_STATE_OFF
+                assert mote.radio.channel == None
 
     # ======================= private =========================================
 
-    # === schedule
+    # === connectivity matrix
 
-    def _schedule_propagate(self):
-        '''
-        schedule a propagation task in the middle of the next slot.
-        FIXME: only schedule for next active slot.
-        '''
-        self.engine.scheduleAtAsn(
-            asn              = self.engine.getAsn() + 1,
-            cb               = self.propagate,
-            uniqueTag        = (None, 'Connectivity.propagate'),
-            intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
-        )
+    def _clear_connectivity_matrix(self):
+        # the connectivity matrix indicates no connectivity at all
+        if self.rssi_floor is None:
+            shape = (len(self.engine.motes), len(self.engine.motes), self.settings.phy_numChans)
+            self.pdr_matrix  = numpy.zeros(shape, dtype=numpy.float32)
+            self.rssi_matrix = numpy.full(shape, -1000, dtype=numpy.float32)
+            self.links       = None
+        else:
+            self.pdr_matrix  = None
+            self.rssi_matrix = None
+            self.links       = [{} for _ in self.engine.motes]
+
+    def _get_links(self, sources, destinations, channel):
+        """
+        Return the PDRs and the RSSIs of the links from the sources (rows) to
+        the destinations (columns) on a channel, as two float64 arrays.
+        """
+
+        if self.links is None:
+            links = numpy.ix_(sources, destinations, [channel])
+            pdrs  = self.pdr_matrix[links][:, :, 0].astype(numpy.float64)
+            rssis = self.rssi_matrix[links][:, :, 0].astype(numpy.float64)
+            return (pdrs, rssis)
+
+        # only the destinations in the neighbor list of a source are considered
+        pdrs    = numpy.zeros((len(sources), len(destinations)))
+        rssis   = numpy.full((len(sources), len(destinations)), -1000.0)
+        columns = dict((destination, j) for (j, destination) in enumerate(destinations))
+        for (i, source) in enumerate(sources):
+            neighbors = self.links[source]
+            for destination in neighbors.viewkeys() & columns.viewkeys():
+                j           = columns[destination]
+                link        = neighbors[destination]
+                pdrs[i, j]  = link[0, channel]
+                rssis[i, j] = link[1, channel]
+        return (pdrs, rssis)
+
+    def _set_rssi(self, mote_id_1, mote_id_2, channel, rssi):
+        # set the same RSSI to the both directions
+        self._set_link(mote_id_1, mote_id_2, channel, rssi=rssi)
+        self._set_link(mote_id_2, mote_id_1, channel, rssi=rssi)
+
+    def _set_pdr(self, mote_id_1, mote_id_2, channel, pdr):
+        # set the same PDR to the both directions
+        self._set_link(mote_id_1, mote_id_2, channel, pdr=pdr)
+        self._set_link(mote_id_2, mote_id_1, channel, pdr=pdr)
+
+    def _set_links(self, mote_id, mote_ids, pdrs, rssis):
+        # set the same PDRs and RSSIs to the both directions of the links
+        # between a mote and other motes, on all the channels
+        if self.links is None:
+            for (matrix, values) in [(self.pdr_matrix, pdrs), (self.rssi_matrix, rssis)]:
+                matrix[mote_id, mote_ids, :] = values[:, numpy.newaxis]
+                matrix[mote_ids, mote_id, :] = values[:, numpy.newaxis]
+            return
+
+        # only the links at or above the floor are stored
+        mote_ids = numpy.asarray(mote_ids, dtype=int)
+        audible  = numpy.asarray(rssis) >= self.rssi_floor
+        links    = self.links[mote_id]
+        if links:
+            # drop the existing links which get below the floor
+            for other_mote_id in mote_ids[~audible].tolist():
+                links.pop(other_mote_id, None)
+                self.links[other_mote_id].pop(mote_id, None)
+
+        # one (2, phy_numChans) array per link and per direction
+        values       = numpy.empty((numpy.count_nonzero(audible), 2, self.settings.phy_numChans), dtype=numpy.float32)
+        values[:, 0] = numpy.asarray(pdrs)[audible, numpy.newaxis]
+        values[:, 1] = numpy.asarray(rssis)[audible, numpy.newaxis]
+        for (other_mote_id, link) in zip(mote_ids[audible].tolist(), values):
+            links[other_mote_id]               = link
+            self.links[other_mote_id][mote_id] = link.copy()
+
+    def _set_link(self, source, destination, channel, pdr=None, rssi=None):
+        """
+        Set the PDR and/or the RSSI of the link from source to destination.
+        'channel' is a channel offset, or slice(None) for all the channels.
+
+        In sparse mode, the link is created when its RSSI is set at or above
+        the floor, and removed when the RSSIs of all its channels get below
+        the floor; the PDR of a link which is not stored is not set.
+        """
+
+        if self.links is None:
+            if pdr is not None:
+                self.pdr_matrix[source, destination, channel]  = pdr
+            if rssi is not None:
+                self.rssi_matrix[source, destination, channel] = rssi
+            return
+
+        link = self.links[source].get(destination)
+        if link is None:
+            if (rssi is None) or (rssi < self.rssi_floor):
+                return
+            link = numpy.zeros((2, self.settings.phy_numChans), dtype=numpy.float32)
+            link[1, :] = -1000
+            self.links[source][destination] = link
+        if pdr is not None:
+            link[0, channel] = pdr
+        if rssi is not None:
+            link[1, channel] = rssi
+            if (link[1] < self.rssi_floor).all():
+                del self.links[source][destination]
 
     # === listeners
 
     def _get_listeners(self, channel):
-        returnVal = []
-        for mote in self.engine.motes:
-            if (mote.radio.state == d.RADIO_STATE_RX) and (mote.radio.channel == channel):
-                returnVal.append(mote.id)
-        return returnVal
+        return sorted(self.listeners[channel])
 
     # === wireless
 
-    def _compute_pdr_with_interference(self, listener, lockon_transmission, interfering_transmissions):
-
-        # shorthand
-        channel = lockon_transmission['channel']
-        for t in interfering_transmissions:
-            assert t['channel'] == channel
-        lockon_srcMac  = lockon_transmission['packet']['mac']['srcMac']
+    def _compute_pdr_with_interference(self, listener, lockon_pdr, lockon_mW, interfering_mWs):
+        """
+        Compute the PDR of the lockon transmission at the listener, given its
+        PDR and power (mW), and the array of the powers (mW) of the
+        interfering transmissions.
+        """
 
         # === compute the SINR
 
-        noise_mW   = self._dBm_to_mW(self.engine.motes[listener].radio.noisepower)
+        noise_dBm  = self.engine.motes[listener].radio.noisepower
+        noise_mW   = self._dBm_to_mW(noise_dBm)
 
         # S = RSSI - N
 
-        signal_mW = self._dBm_to_mW(self.get_rssi(lockon_srcMac, listener, channel)) - noise_mW
+        signal_mW = lockon_mW - noise_mW
         if signal_mW < 0.0:
             # RSSI has not to be below the noise level.
             # If this happens, return very low SINR (-10.0dB)
             return -10.0
 
-        # I = RSSI - N
+        # I = RSSI - N; RSSI has not to be below noise level. If this happens,
+        # set interference to 0.0
 
-        totalInterference_mW = 0.0
-        for interfering_tran in interfering_transmissions:
-            interfering_srcMac = interfering_tran['packet']['mac']['srcMac']
-            interference_mW = self._dBm_to_mW(self.get_rssi(interfering_srcMac, listener, channel)) - noise_mW
-            if interference_mW < 0.0:
-                # RSSI has not to be below noise level.
-                # If this happens, set interference to 0.0
-                interference_mW = 0.0
-            totalInterference_mW += interference_mW
+        if len(interfering_mWs):
+            interference_mW      = interfering_mWs - noise_mW
+            totalInterference_mW = float(numpy.maximum(interference_mW, 0.0).sum())
+        else:
+            totalInterference_mW = 0.0
 
         sinr_dB = self._mW_to_dBm( signal_mW / (totalInterference_mW + noise_mW) )
 
         # === compute the interference PDR
 
-        # shorthand
-        noise_dBm = self.engine.motes[listener].radio.noisepower
-
         # RSSI of the interfering transmissions
         interference_rssi = self._mW_to_dBm(
             self._dBm_to_mW(sinr_dB + noise_dBm) +
-            self._dBm_to_mW(noise_dBm)
+            noise_mW
         )
 
         # PDR of the interfering transmissions
@@ -360,10 +635,6 @@ class ConnectivityBase(object):
 
         # === compute the resulting PDR
 
-        lockon_pdr = self.get_pdr(
-            source      = lockon_srcMac,
-            destination = listener,
-            channel     = channel)
         returnVal  = lockon_pdr * interference_pdr
 
         return returnVal
@@ -377,51 +648,7 @@ class ConnectivityBase(object):
         return 10 * math.log10(mW)
 
     def _rssi_to_pdr(self,rssi):
-        """
-        rssi and pdr relationship obtained by experiment below
-        http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
-        """
-
-        rssi_pdr_table = {
-            -97:    0.0000,  # this value is not from experiment
-            -96:    0.1494,
-            -95:    0.2340,
-            -94:    0.4071,
-            # <-- 50% PDR is here, at RSSI=-93.6
-            -93:    0.6359,
-            -92:    0.6866,
-            -91:    0.7476,
-            -90:    0.8603,
-            -89:    0.8702,
-            -88:    0.9324,
-            -87:    0.9427,
-            -86:    0.9562,
-            -85:    0.9611,
-            -84:    0.9739,
-            -83:    0.9745,
-            -82:    0.9844,
-            -81:    0.9854,
-            -80:    0.9903,
-            -79:    1.0000,  # this value is not from experiment
-        }
-
-        minRssi = min(rssi_pdr_table.keys())
-        maxRssi = max(rssi_pdr_table.keys())
-
-        floorRssi = int(math.floor(rssi))
-        if  floorRssi < minRssi:
-            pdr = 0.0
-        elif floorRssi >= maxRssi:
-            pdr = 1.0
-        else:
-            pdrLow    = rssi_pdr_table[floorRssi]
-            pdrHigh   = rssi_pdr_table[floorRssi+1]
-            # linear interpolation
-            pdr       = (pdrHigh - pdrLow) * (rssi - float(floorRssi)) + pdrLow
-
-        assert 0 <= pdr <= 1.0
-
-        return pdr
+        return rssi_to_pdr(rssi)
 
 class ConnectivityFullyMeshed(ConnectivityBase):
     """
@@ -431,11 +658,7 @@ class ConnectivityFullyMeshed(ConnectivityBase):
     def _init_connectivity_matrix(self):
         for source in self.engine.motes:
             for destination in self.engine.motes:
-                for channel in range(self.settings.phy_numChans):
-                    self.connectivity_matrix[source.id][destination.id][channel] = {
-                        "pdr":    1.00,
-                        "rssi":    -10,
-                    }
+                self._set_link(source.id, destination.id, slice(None), pdr=1.00, rssi=-10)
 
 class ConnectivityLinear(ConnectivityBase):
     """
@@ -448,15 +671,8 @@ class ConnectivityLinear(ConnectivityBase):
         parent = None
         for mote in self.engine.motes:
             if parent is not None:
-                for channel in range(self.settings.phy_numChans):
-                    self.connectivity_matrix[mote.id][parent.id][channel] = {
-                        "pdr": 1.00,
-                        "rssi": -10,
-                    }
-                    self.connectivity_matrix[parent.id][mote.id][channel] = {
-                        "pdr": 1.00,
-                        "rssi": -10,
-                    }
+                self._set_link(mote.id, parent.id, slice(None), pdr=1.00, rssi=-10)
+                self._set_link(parent.id, mote.id, slice(None), pdr=1.00, rssi=-10)
             parent = mote
 
 
@@ -468,19 +684,15 @@ class ConnectivityGrid(ConnectivityBase):
         (0,0) <----> (0,1) <----> (0,2) <----> ... <----> (0,n-1)
 
     """
-    def __init__(self):
-        # the singleton has already been initialized
-        cls = type(self)
-        if cls._init:
-            return
+    def __init__(self, engine):
 
         # attributes specific to ConnectivityRandom
         self.coordinates = {}  # (x, y) indexed by mote_id
-        self.pister_hack = PisterHackModel()
+        self.pister_hack = PisterHackModel(engine)
         
 
-        # initialize the singleton
-        super(ConnectivityGrid, self).__init__()
+        # initialize the base class
+        super(ConnectivityGrid, self).__init__(engine)
 
 
 
@@ -559,17 +771,6 @@ class ConnectivityGrid(ConnectivityBase):
         return math.sqrt(pow((mote_b[0] - mote_a[0]), 2) + pow((mote_b[1] - mote_a[1]), 2))
 
 
-    def _set_rssi(self, mote_id_1, mote_id_2, channel, rssi):
-        # set the same RSSI to the both directions
-        self.connectivity_matrix[mote_id_1][mote_id_2][channel]['rssi'] = rssi
-        self.connectivity_matrix[mote_id_2][mote_id_1][channel]['rssi'] = rssi
-
-    def _set_pdr(self, mote_id_1, mote_id_2, channel, pdr):
-        # set the same RSSI to the both directions
-        self.connectivity_matrix[mote_id_1][mote_id_2][channel]['pdr'] = pdr
-        self.connectivity_matrix[mote_id_2][mote_id_1][channel]['pdr'] = pdr
-
-
 
 
 
@@ -586,133 +787,214 @@ class ConnectivityK7(ConnectivityBase):
     def _init_connectivity_matrix(self):
         """ Fill the matrix using the connectivity trace"""
 
-        # create the matrix (You take the red pill and stay in Wonderland)
-        for source in self.engine.motes:
-            self.connectivity_matrix[source.id] = {}
-            for dest in self.engine.motes:
-                self.connectivity_matrix[source.id][dest.id] = {}
-                for chan in range(self.settings.phy_numChans):
-                    self.connectivity_matrix[source.id][dest.id][chan] = {}
+        if self.settings.conn_trace.endswith(K7_BINARY_EXTENSION):
+            self.trace = K7BinaryTrace(self.settings.conn_trace)
+            if self.trace.header['slot_duration'] != self.settings.tsch_slotDuration:
+                raise ValueError(
+                    '{0} was converted for a slot duration of {1}s'.format(
+                        self.settings.conn_trace,
+                        self.trace.header['slot_duration']
+                    )
+                )
+        else:
+            self.trace = K7TraceReader(self.settings.conn_trace, self.settings.tsch_slotDuration)
 
         # load first trace transaction and init
-        self.first_date = None
-        with gzip.open(self.settings.conn_trace, 'r') as trace:
-            trace_header = json.loads(trace.readline())
-            csv_header = trace.readline().strip().split(',')
+        self._update_links(self.trace.read_first_transaction())
+        self._schedule_update()
 
-            for line in trace:
-                # parse line
-                row = self._parse_line(csv_header, line)
-
-                # only read first transaction
-                if row['transaction_id'] > 0:
-                    break
+    # ======================= private =========================================
 
-                # save file position
-                self.trace_position = trace.tell()
+    def _schedule_update(self):
+        # the matrix is updated at the ASN of the next row of the trace; past
+        # the last row, the update raises an exception
+        self.connectivity_matrix_timestamp = self.trace.get_next_asn()
+        if self.connectivity_matrix_timestamp is None:
+            self.connectivity_matrix_timestamp = self.engine.asn + 1
 
-                # update matrix value
-                first_channel = trace_header['channels'][0]
-                for channel in row['channels']:
-                    channel_offset = channel - first_channel
-                    self.connectivity_matrix[row['src']][row['dst']][channel_offset] = {
-                        'pdr': float(row['pdr']),
-                        'rssi': row['mean_rssi'],
-                    }
+        self.engine.scheduleAtAsn(
+            asn              = self.connectivity_matrix_timestamp,
+            cb               = self._update_connectivity_matrix,
+            uniqueTag        = (None, 'Connectivity._update_connectivity_matrix'),
+            intraSlotOrder   = d.INTRASLOTORDER_STARTSLOT,
+        )
 
-                # save matrix timestamp
-                self.connectivity_matrix_timestamp = row['asn']
+    def _update_connectivity_matrix(self):
+        """ Apply the rows of the trace up to the current ASN """
 
-    # overloaded methods
+        if self.trace.get_next_asn() is None:
+            raise Exception("""
+                        Reached the end of the trace file without finding a matching row.
+                        The simulation duration is longer than the trace duration.
+                        """)
 
-    def get_pdr(self, source, destination, channel):
-        # update PDR matrix if we are a new row in our K7 file
-        if  self.connectivity_matrix_timestamp < self.engine.asn:
-            self.connectivity_matrix_timestamp = self._update_connectivity_matrix_from_trace()
+        self._update_links(self.trace.read_until(self.engine.asn))
+        self._schedule_update()
 
-        # then call the parent's method
-        return super(ConnectivityK7, self).get_pdr(source, destination, channel)
+    def _update_links(self, rows):
+        # the trace may cover more channels than the simulated ones
+        for (_, src, dst, channel, _, pdr, rssi) in rows:
+            if channel < self.settings.phy_numChans:
+                self._set_link(src, dst, channel, pdr=pdr, rssi=rssi)
 
-    def get_rssi(self, source, destination, channel):
-        # update PDR matrix if we are a new row in our K7 file
-        if  self.connectivity_matrix_timestamp < self.engine.asn:
-            self.connectivity_matrix_timestamp = self._update_connectivity_matrix_from_trace()
+class K7TraceReader(object):
+    """
+    Forward-only reader of a K7 trace (.k7.gz), open until the end of the
+    trace. Rows are read as tuples of the fields of K7_BINARY_ROW, one per
+    channel.
+    """
 
-        # then call the parent's method
-        print source, destination, channel
-        return super(ConnectivityK7, self).get_rssi(source, destination, channel)
+    def __init__(self, path, slot_duration):
 
-    # ======================= private =========================================
+        # store params
+        self.path          = path
+        self.slot_duration = slot_duration
 
-    def _update_connectivity_matrix_from_trace(self):
-        """ Read the connectivity trace and fill the connectivity matrix
-        :return: Timestamp when to update the matrix again
+        # local variables
+        self.trace         = gzip.open(path, 'r')
+        self.header        = json.loads(self.trace.readline())
+        self.csv_header    = self.trace.readline().strip().split(',')
+        self.first_channel = self.header['channels'][0]
+        self.first_date    = None
+        self.last_date     = None # (string, ASN) of the last line read
+        self.num_lines     = 0    # number of trace lines read
+        self.next_rows     = None # rows of the next line
+        self._read_line()
+
+    def __getstate__(self):
+        # the trace is read again up to the same line when unpickled
+        return (self.path, self.slot_duration, self.num_lines)
+
+    def __setstate__(self, state):
+        (path, slot_duration, num_lines) = state
+        self.__init__(path, slot_duration)
+        while self.num_lines < num_lines:
+            self._read_line()
+
+    def close(self):
+        self.trace.close()
+
+    def get_next_asn(self):
         """
+        Return the ASN of the next row, None at the end of the trace.
+        """
+        if self.next_rows is None:
+            return None
+        return self.next_rows[0][0]
+
+    def read_first_transaction(self):
+        rows = []
+        while (self.next_rows is not None) and (self.next_rows[0][4] == 0):
+            rows += self.next_rows
+            self._read_line()
+        return rows
+
+    def read_until(self, asn):
+        """
+        Return the rows up to asn, the remaining rows if asn is None.
+        """
+        rows = []
+        while (self.next_rows is not None) and ((asn is None) or (self.next_rows[0][0] <= asn)):
+            rows += self.next_rows
+            self._read_line()
+        return rows
+
+    def _read_line(self):
+        line = self.trace.readline()
+        if not line:
+            self.next_rows = None
+            self.close()
+            return
+        self.num_lines += 1
+
+        vals = dict(zip(self.csv_header, line.strip().split(',')))
+
+        # consecutive lines mostly share their datetime; parse it once
+        if (self.last_date is None) or (self.last_date[0] != vals['datetime']):
+            date = datetime.strptime(vals['datetime'], "%Y-%m-%d %H:%M:%S")
+            if self.first_date is None:
+                self.first_date = date
+            self.last_date = (
+                vals['datetime'],
+                _get_k7_asn(self.first_date, date, self.slot_duration)
+            )
 
-        with gzip.open(self.settings.conn_trace, 'r') as trace:
-            trace_header = json.loads(trace.readline())
-            csv_header = trace.readline().strip().split(',')
-
-            # move to last recorded position
-            trace.seek(self.trace_position)
+        if vals['mean_rssi'] == '':
+            rssi = -1000
+        else:
+            rssi = float(vals['mean_rssi'])
+        self.next_rows = [
+            (
+                self.last_date[1],
+                int(vals['src']),
+                int(vals['dst']),
+                int(channel) - self.first_channel,
+                int(vals['transaction_id']),
+                float(vals['pdr']),
+                rssi,
+            )
+            for channel in vals['channels'].strip("[]").split(';')
+        ]
 
-            for line in trace:
-                # parse line
-                row = self._parse_line(csv_header, line)
+class K7BinaryTrace(object):
+    """
+    Binary K7 trace written by convert_k7_to_binary(), memory-mapped.
+    """
 
-                # save file position
-                self.trace_position = trace.tell()
+    def __init__(self, path):
 
-                # return next update ASN
-                if row['asn'] > self.engine.asn:
-                    return row['asn']
+        # store params
+        self.path   = path
 
-                # update matrix value
-                first_channel = trace_header['channels'][0]
-                for channel in row['channels']:
-                    channel_offset = channel - first_channel
-                    self.connectivity_matrix[row['src']][row['dst']][channel_offset] = {
-                        'pdr': float(row['pdr']),
-                        'rssi': row['mean_rssi'],
-                    }
+        (self.header, offset)       = _read_binary_header(path, K7_BINARY_MAGIC)
 
-        raise Exception("""
-                        Reached the end of the trace file without finding a matching row.
-                        The simulation duration is longer than the trace duration.
-                        """)
+        # ASN index and rows
+        (self.index_asn, offset)    = _map_binary_array(path, offset, '<i8', (self.header['num_asns'],))
+        (self.index_start, offset)  = _map_binary_array(path, offset, '<i8', (self.header['num_asns'] + 1,))
+        (self.rows, offset)         = _map_binary_array(path, offset, K7_BINARY_ROW, (self.header['num_rows'],))
 
-    def _parse_line(self, csv_header, line):
-        # === read and parse line
-        vals = line.strip().split(',')
-        row = dict(zip(csv_header, vals))
+        # index of the next row
+        self.position    = 0
 
-        # === change row format
+    def __getstate__(self):
+        # the file is mapped again when unpickled
+        return (self.path, self.position)
 
-        row['src'] = int(row['src'])
-        row['dst'] = int(row['dst'])
-        row['transaction_id'] = int(row['transaction_id'])
-        row['datetime'] = datetime.strptime(row['datetime'], "%Y-%m-%d %H:%M:%S")
+    def __setstate__(self, state):
+        (path, position) = state
+        self.__init__(path)
+        self.position = position
 
-        # rssi
-        if row['mean_rssi'] == '':
-            row['mean_rssi'] = -1000
-        else:
-            row['mean_rssi'] = float(row['mean_rssi'])
+    def get_next_asn(self):
+        """
+        Return the ASN of the next row, None at the end of the trace.
+        """
+        if self.position == len(self.rows):
+            return None
+        return int(self.rows[self.position]['asn'])
 
-        # channel string to list
-        row['channels'] = [int(c) for c in row['channels'].strip("[]").split(';')]
+    def read_first_transaction(self):
+        return self._read(self.header['num_initial_rows'])
 
-        # === add ASN value to row
+    def read_until(self, asn):
+        """
+        Return the rows up to asn, the remaining rows if asn is None.
+        """
+        if asn is None:
+            return self._read(len(self.rows))
+        return self._read(self.seek(asn))
 
-        # save first row datetime if it does not exits
-        if self.first_date is None:
-            self.first_date = row['datetime']
+    def seek(self, asn):
+        """
+        Return the index of the first row of an ASN larger than asn.
+        """
+        return int(self.index_start[numpy.searchsorted(self.index_asn, asn, side='right')])
 
-        # convert row datetime to ASN
-        time_delta = row['datetime'] - self.first_date
-        row['asn'] = int(time_delta.total_seconds() / float(self.settings.tsch_slotDuration))
+    def _read(self, end):
+        rows = self.rows[self.position:end].tolist()
+        self.position = max(self.position, end)
+        return rows
 
-        return row
 
 class ConnectivityRandom(ConnectivityBase):
     """Random (topology) connectivity using the Pister-Hack model
@@ -721,22 +1003,31 @@ class ConnectivityRandom(ConnectivityBase):
     many neighbors as 'conn_random_init_min_neighbors', who have good
     PDR values with the mote.
 
-    Computed PDR and RSSI are computed on the fly; they could vary at
-    every transmission.
+    The PDR and RSSI of each link are computed once, when the motes are
+    placed (or read from the topology cache); they don't vary during the
+    run.
+
+    The motes are placed with the random numbers of the run, unless
+    'conn_random_topology_seed' is set: then they are placed from that seed,
+    and the runs of all the seeds share the same topology.
     """
 
-    def __init__(self):
-        # the singleton has already been initialized
-        cls = type(self)
-        if cls._init:
-            return
+    def __init__(self, engine):
+
+        # 'rw' read or wrote the topology in topology_Random_<N>.txt
+        if hasattr(engine.settings, 'rw'):
+            raise ValueError(
+                '"rw" is not supported anymore; use "conn_random_topology_seed" '
+                'to keep the same topology across runs, and '
+                '"conn_random_topology_cache" to store it'
+            )
 
         # attributes specific to ConnectivityRandom
         self.coordinates = {}  # (x, y) indexed by mote_id
-        self.pister_hack = PisterHackModel()
+        self.pister_hack = PisterHackModel(engine)
 
-        # initialize the singleton
-        super(ConnectivityRandom, self).__init__()
+        # initialize the base class
+        super(ConnectivityRandom, self).__init__(engine)
 
 
         # # just or test here: Fadoua
@@ -772,61 +1063,33 @@ class ConnectivityRandom(ConnectivityBase):
 
         assert init_min_neighbors <= self.settings.exec_numMotes
 
-        # this line as well is from my first implementation
-        if self.settings.conn_class == 'Random':
-            topo = open("topology"+str('_')+str(self.settings.conn_class )+str('_')+str(len(self.engine.motes))+".txt",self.settings.rw)
-            print('create and empty file for the topology')
-
-
-        # this is from my first implementation
-        if self.settings.conn_class == 'Random' and self.settings.rw == 'r':
-            lines = []
-            for line in topo :
-                lines += [line]
-            if lines :
-                i = -1
-                for mote in self.engine.motes :
-                    i += 1
-                    coord = lines[i].split(' ') # split with a space
-                    coord.pop(len(coord)-1) # pop removes the item at the given position in the list
-
-                    mote_is_deployed = False
-                    while mote_is_deployed is False:
-                        self.coordinates[mote.id] = (float(coord[0]),float(coord[1]))
-                        mote.setLocation(float(coord[0]), float(coord[1]))  # added Fadoua
-                        # count deployed motes who have enough PDR values to this mote
-                        good_pdr_count = 0
-                        j = 0
-                        for mote_id in self.coordinates.keys():
-                            if mote.id != mote_id:
-                                rssi = float(coord[2 + j])
-                                pdr = float(coord[3 + j])
-                                
-                                for channel in range(0, self.settings.phy_numChans):
-                                    
-                                    self._set_rssi(mote.id, mote_id, channel, rssi)
-                                    self._set_pdr(mote.id, mote_id, channel, pdr)
-
-                                j+=2
-        
-                        mote_is_deployed = True
-
-                    
+        # the topology is read from the cache when it was placed before, with
+        # the same settings and from the same random state
+        cache_path = self._get_topology_cache_path()
+        if (cache_path is not None) and os.path.exists(cache_path):
+            self._read_topology(cache_path)
+            return
 
-                for mote in self.engine.motes :
-                    for mote_id in self.coordinates.keys():
-                            rssi=self.get_rssi(mote.id, mote_id, channel=0)
-                            pdr=self.get_pdr(mote.id, mote_id, channel=0)
-                            # print('mote:', mote.id, 'and mote', mote_id, 'RSSI:', rssi, 'PDR:', pdr)
-                                    
+        # the placement draws from the engine's random, unless the topology
+        # has a seed of its own, independent of the seed of the run
+        if self.settings.conn_random_topology_seed is None:
+            generator = self.engine.random
+        else:
+            generator = random.Random(self.settings.conn_random_topology_seed)
 
-        # this is to be called whenever I need set the location of the motes
-        #for mote in self.engine.motes or self.settings.rw == 'r':
         # determine coordinates of the motes
         # this is what is done by the developers in v1.1.4
+
+        # the deployed motes are indexed by a grid of square cells as large as
+        # the radio range: only the motes in the 3x3 cells around a tentative
+        # coordinate can have a non-zero PDR with it
+        cell_side  = self._get_radio_range()
+        grid       = {} # mote_ids indexed by cell
+        positions  = numpy.zeros((len(self.engine.motes), 2)) # indexed by mote_id
+        variations = numpy.zeros(len(self.engine.motes))      # indexed by mote_id
+        links      = [None] * len(self.engine.motes)          # (mote_ids, rssis, pdrs) indexed by mote_id
+
         for target_mote in self.engine.motes:
-            if self.settings.rw == 'r': # added Fadoua
-                continue
 
             mote_is_deployed = False
             while mote_is_deployed is False:
@@ -837,146 +1100,205 @@ class ConnectivityRandom(ConnectivityBase):
                     mid_coodinate= square_side/2
                     self.coordinates[target_mote.id] = (mid_coodinate, mid_coodinate) # set it in the middle
                     target_mote.setLocation(mid_coodinate, mid_coodinate)  # added Fadoua
+                    positions[target_mote.id] = self.coordinates[target_mote.id]
+                    self._add_to_grid(grid, cell_side, target_mote.id)
                     mote_is_deployed = True
                     continue
 
                 coordinate = (
-                    square_side * random.random(),
-                    square_side * random.random()
+                    square_side * generator.random(),
+                    square_side * generator.random()
                 )
 
+                # draw the RSSI variations of the links to all the deployed
+                # motes, in the order compute_rssi() would draw them, so that
+                # the topology of a seed doesn't depend on the grid
+                deployed_mote_ids = self.coordinates.keys()
+                variations[deployed_mote_ids] = [
+                    self.pister_hack.draw_rssi_variation(generator) for _ in deployed_mote_ids
+                ]
+
                 # count deployed motes who have enough PDR values to this
-                # mote
-                good_pdr_count = 0
-                for deployed_mote_id in self.coordinates.keys():
-                    rssi = self.pister_hack.compute_rssi(
-                        {
-                            'mote'      : target_mote,
-                            'coordinate': coordinate
-                        },
-                        {
-                            'mote'      : self._get_mote(deployed_mote_id),
-                            'coordinate': self.coordinates[deployed_mote_id]
-                        }
+                # mote; the motes out of the radio range have a PDR of 0
+                if init_min_pdr <= 0:
+                    good_pdr_count = len(deployed_mote_ids)
+                else:
+                    (_, pdrs) = self._compute_links(
+                        target_mote,
+                        coordinate,
+                        self._get_motes_around(grid, cell_side, coordinate),
+                        positions,
+                        variations
                     )
-                    pdr = self.pister_hack.convert_rssi_to_pdr(rssi)
-                    
-                    # memorize the rssi and pdr values at channel 0
-                    self._set_rssi(target_mote.id, deployed_mote_id, 0, rssi)
-                    self._set_pdr(target_mote.id, deployed_mote_id, 0, pdr)
-
-                    if init_min_pdr <= pdr:
-                        good_pdr_count += 1
+                    good_pdr_count = int(numpy.count_nonzero(init_min_pdr <= pdrs))
 
                 # determine whether we deploy this mote or not
                 if (((len(self.coordinates) <= init_min_neighbors) and (len(self.coordinates) == good_pdr_count)) or ((init_min_neighbors < len(self.coordinates)) and (init_min_neighbors <= good_pdr_count))):
-                    
+
+                    # set the rssi and pdr values to all the channels
+                    (rssis, pdrs) = self._compute_links(
+                        target_mote,
+                        coordinate,
+                        deployed_mote_ids,
+                        positions,
+                        variations
+                    )
+                    self._set_links(target_mote.id, deployed_mote_ids, pdrs, rssis)
+                    links[target_mote.id] = (deployed_mote_ids, rssis, pdrs)
+
                     # fix the coordinate of the mote
                     self.coordinates[target_mote.id] = coordinate
-                    # copy the rssi and pdr values to other channels
-                    # this is new as compared with the release v1.1.3
-                    for deployed_mote_id in self.coordinates.keys():
-                        rssi = self.get_rssi(target_mote.id, deployed_mote_id, channel=0)
-                        pdr  = self.get_pdr(target_mote.id, deployed_mote_id, channel=0)
-                        
-
-                        for channel in range(1, self.settings.phy_numChans):
-                            self._set_rssi(target_mote.id, deployed_mote_id, channel, rssi)
-                            self._set_pdr(target_mote.id, deployed_mote_id, channel, pdr)
-                            # print('src mote:', target_mote.id, 'dst mote:', deployed_mote_id)
-                            # print('rssi: ', rssi)
-                            # print('pdr: ', pdr)
-                            # print('----------------')
+                    positions[target_mote.id] = coordinate
+                    self._add_to_grid(grid, cell_side, target_mote.id)
 
                     target_mote.setLocation(coordinate[0], coordinate[1]) # added Fadoua
                     mote_is_deployed = True
 
-                    
-            
                 else:
-                    # remove memorized values at channel 0
-                    for deployed_mote_id in self.coordinates.keys():
-                        self._clear_rssi(target_mote.id, deployed_mote_id, channel=0)
-                        self._clear_pdr(target_mote.id, deployed_mote_id, channel=0)
                     # try another random coordinate
                     continue
 
-
-        # this is new here I added it from my first implementation 
-        for mote in self.engine.motes:
-            if self.settings.conn_class == 'Random' and self.settings.rw == 'w':
-                (x,y) = self.coordinates[mote.id]
-                topo.write(str(x) + " "+str(y) + " ")
-            
-            for m in self.engine.motes:                                    
-                if mote==m: 
-                    # topo.write(str(0.0) + " ") # this is to fill in the matix with 0.0 whenever we calculate pdr between mote(x y) and mote(x y)
-                    continue
-                if self.settings.conn_class == 'Random' and self.settings.rw == 'w':
-                # else:
-            
-                    topo.write(str(self.get_rssi(mote.id, m.id, 0)) + " " + str(self.get_pdr(mote.id, m.id, 0)) + " ")
-                    # topo.write(str(self.get_rssi(mote.id, m.id, 0)) + " ")
-
-
-                    # topo.write(str(self._get_initial_pdr(
-                    #         {
-                    #             'mote'      : mote,
-                    #             'coordinate': self.coordinates[mote.id]
-                    #         },
-                    #         {
-                    #             'mote'      : m,
-                    #             'coordinate': self.coordinates[m.id]
-                    #         }
-                    #     )
-                    # ) + " ")
-
-            if self.settings.conn_class == 'Random' and self.settings.rw == 'w':
-                topo.write('\n')
-
-
-
-
+        if cache_path is not None:
+            self._write_topology(cache_path, links)
 
     def _get_mote(self, mote_id):
-        # there must be a mote having mote_id. otherwise, the following line
-        # raises an exception.
-        return [mote for mote in self.engine.motes if mote.id == mote_id][0]
-
-    def _set_rssi(self, mote_id_1, mote_id_2, channel, rssi):
-        # set the same RSSI to the both directions
-        self.connectivity_matrix[mote_id_1][mote_id_2][channel]['rssi'] = rssi
-        self.connectivity_matrix[mote_id_2][mote_id_1][channel]['rssi'] = rssi
-
-    def _clear_rssi(self, mote_id_1, mote_id_2, channel):
-        INVALID_RSSI = -1000
-        self._set_rssi(mote_id_1, mote_id_2, channel, rssi=INVALID_RSSI)
-
-    def _set_pdr(self, mote_id_1, mote_id_2, channel, pdr):
-        # set the same RSSI to the both directions
-        self.connectivity_matrix[mote_id_1][mote_id_2][channel]['pdr'] = pdr
-        self.connectivity_matrix[mote_id_2][mote_id_1][channel]['pdr'] = pdr
-
-    def _clear_pdr(self, mote_id_1, mote_id_2, channel):
-        self._set_pdr(mote_id_1, mote_id_2, channel, pdr=0)
+        # motes are created in the order of their ids
+        mote = self.engine.motes[mote_id]
+        assert mote.id == mote_id
+        return mote
+
+    def _get_topology_cache_path(self):
+        # the name of the file is a hash of what determines the topology
+        cache_directory = self.settings.conn_random_topology_cache
+        if cache_directory is None:
+            return None
+
+        key = json.dumps(
+            [
+                TOPOLOGY_MAGIC,
+                self.settings.conn_class,
+                self.settings.exec_numMotes,
+                self.settings.conn_random_square_side,
+                self.settings.conn_random_init_min_pdr,
+                self.settings.conn_random_init_min_neighbors,
+                self.settings.conn_sparse_rssi_floor,
+                self._get_topology_origin(),
+            ]
+        )
+        return os.path.join(
+            cache_directory,
+            'topology_{0}.bin'.format(hashlib.sha1(key).hexdigest())
+        )
 
-    
+    def _get_topology_origin(self):
+        # the seed of the topology, or else the state of the engine's random
+        # before the placement, which stands for the seed of the run and for
+        # every draw made before the placement
+        if self.settings.conn_random_topology_seed is None:
+            return self.engine.random.getstate()
+        else:
+            return self.settings.conn_random_topology_seed
+
+    def _write_topology(self, path, links):
+        num_motes   = len(self.engine.motes)
+        coordinates = numpy.array([self.coordinates[mote_id] for mote_id in range(num_motes)])
+        rssis       = numpy.zeros(num_motes * (num_motes - 1) / 2, dtype=numpy.float32)
+        pdrs        = numpy.zeros(num_motes * (num_motes - 1) / 2, dtype=numpy.float32)
+        for (mote_id, (mote_ids, mote_rssis, mote_pdrs)) in enumerate(links[1:], start=1):
+            row              = mote_id * (mote_id - 1) / 2 + numpy.array(mote_ids, dtype=int)
+            rssis[row]       = mote_rssis
+            pdrs[row]        = mote_pdrs
+
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # the directory exists, possibly created by another simulation
+            pass
 
+        _write_binary_file(
+            path,
+            TOPOLOGY_MAGIC,
+            {
+                'num_motes':    num_motes,
+                # the engine's random is left as if the motes were placed; it
+                # is not drawn from when the topology has its own seed
+                'random_state': (
+                    self.engine.random.getstate()
+                    if self.settings.conn_random_topology_seed is None
+                    else None
+                ),
+            },
+            [coordinates, rssis, pdrs]
+        )
 
-    def _get_initial_pdr(self, src, dst,):
-        # return the PDR computed from the mean RSSI by the Pister Hack model.
-        
-        # rssi = self.pister_hack.compute_mean_rssi(src, dst)
-        rssi = self.pister_hack.compute_rssi(src, dst)   
-        pdr  = self.pister_hack.convert_rssi_to_pdr(rssi)
-        #print('---computed pdr for src and dst',src, dst, pdr)
-        
+    def _read_topology(self, path):
+        (header, offset)      = _read_binary_header(path, TOPOLOGY_MAGIC)
+        num_motes             = header['num_motes']
+        assert num_motes == len(self.engine.motes)
+        (coordinates, offset) = _map_binary_array(path, offset, numpy.float64, (num_motes, 2))
+        (rssis, offset)       = _map_binary_array(path, offset, numpy.float32, (num_motes * (num_motes - 1) / 2,))
+        (pdrs, offset)        = _map_binary_array(path, offset, numpy.float32, (num_motes * (num_motes - 1) / 2,))
 
-        # rssi = self._set_rssi(mote_id_1.id, mote_id_2, 0, rssi)
-        # pdr  = self._set_pdr(mote_id_1.id, mote_id_2, 0, pdr)
+        for mote in self.engine.motes:
+            (x, y) = coordinates[mote.id].tolist()
+            self.coordinates[mote.id] = (x, y)
+            mote.setLocation(x, y)
+
+            row = slice(mote.id * (mote.id - 1) / 2, mote.id * (mote.id + 1) / 2)
+            self._set_links(mote.id, range(mote.id), pdrs[row], rssis[row])
+
+        if header['random_state'] is not None:
+            (version, internal_state, gauss_next) = header['random_state']
+            self.engine.random.setstate((version, tuple(internal_state), gauss_next))
+
+    def _get_radio_range(self):
+        # distance (in km) beyond which no link can have a non-zero PDR
+        return self.pister_hack.compute_max_distance(
+            max(mote.radio.txPower for mote in self.engine.motes) +
+            2 * max(mote.radio.antennaGain for mote in self.engine.motes)
+        )
 
+    def _get_cell(self, cell_side, coordinate):
+        return (
+            int(math.floor(coordinate[0] / cell_side)),
+            int(math.floor(coordinate[1] / cell_side))
+        )
 
-        return pdr
+    def _add_to_grid(self, grid, cell_side, mote_id):
+        cell = self._get_cell(cell_side, self.coordinates[mote_id])
+        grid.setdefault(cell, []).append(mote_id)
+
+    def _get_motes_around(self, grid, cell_side, coordinate):
+        # return the deployed motes in the 3x3 cells around a coordinate
+        (column, row) = self._get_cell(cell_side, coordinate)
+        mote_ids      = []
+        for c in range(column - 1, column + 2):
+            for r in range(row - 1, row + 2):
+                mote_ids += grid.get((c, r), [])
+        return mote_ids
+
+    def _compute_links(self, target_mote, coordinate, mote_ids, positions, variations):
+        # RSSIs and PDRs of the links from a mote at a coordinate to motes;
+        # positions and variations are indexed by mote_id
+        rssis = self.pister_hack.compute_rssi_matrix(
+            [target_mote],
+            numpy.array([coordinate]),
+            [self._get_mote(mote_id) for mote_id in mote_ids],
+            positions[mote_ids],
+            variations = variations[mote_ids][numpy.newaxis, :]
+        )[0]
+        return (rssis, self.pister_hack.convert_rssi_to_pdr_matrix(rssis))
+
+    def regenerate(self, random_seed):
+        """Place the motes again, after seeding the engine's random with random_seed
+
+        Much cheaper than creating a new engine, to sweep over many random
+        topologies with the same settings.
+        """
+        self.engine.random.seed(random_seed)
+        self.coordinates = {}
+        self._clear_connectivity_matrix()
+        self._init_connectivity_matrix()
 
 
 class PisterHackModel(object):
@@ -985,36 +1307,12 @@ class PisterHackModel(object):
     TWO_DOT_FOUR_GHZ         = 2400000000 # Hz
     SPEED_OF_LIGHT           =  299792458 # m/s
 
-    # RSSI and PDR relationship obtained by experiment; dataset was available
-    # at the link shown below:
-    # http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
-    RSSI_PDR_TABLE = {
-        -97:    0.0000,  # this value is not from experiment
-        -96:    0.1494,
-        -95:    0.2340,
-        -94:    0.4071,
-        # <-- 50% PDR is here, at RSSI=-93.6
-        -93:    0.6359,
-        -92:    0.6866,
-        -91:    0.7476,
-        -90:    0.8603,
-        -89:    0.8702,
-        -88:    0.9324,
-        -87:    0.9427,
-        -86:    0.9562,
-        -85:    0.9611,
-        -84:    0.9739,
-        -83:    0.9745,
-        -82:    0.9844,
-        -81:    0.9854,
-        -80:    0.9903,
-        -79:    1.0000,  # this value is not from experiment
-    }
-
-    def __init__(self):
-
-        # singleton
-        self.engine   = SimEngine.SimEngine()
+    RSSI_PDR_TABLE           = RSSI_PDR_TABLE
+
+    def __init__(self, engine):
+
+        # store params
+        self.engine   = engine
 
         # remember what RSSI value is computed for a mote at an ASN; the same
         # RSSI value will be returned for the same motes and the ASN.
@@ -1044,8 +1342,12 @@ class PisterHackModel(object):
         # model.
         return pr - self.PISTER_HACK_LOWER_SHIFT / 2    # choosing the "mean" value
 
-    def compute_rssi(self, src, dst):
-        """Compute RSSI between the points of a and b using Pister Hack"""
+    def compute_rssi(self, src, dst, variation=None):
+        """Compute RSSI between the points of a and b using Pister Hack
+
+        'variation' is the value drawn by draw_rssi_variation(); it's drawn
+        here when not given.
+        """
 
         assert sorted(src.keys()) == sorted(['mote', 'coordinate'])
         assert sorted(dst.keys()) == sorted(['mote', 'coordinate'])
@@ -1053,36 +1355,79 @@ class PisterHackModel(object):
         # compute the mean RSSI (== friis - 20)
         mu = self.compute_mean_rssi(src, dst)
 
+        if variation is None:
+            variation = self.draw_rssi_variation()
+
+        return mu + variation
+
+    def draw_rssi_variation(self, generator=None):
         # the receiver will receive the packet with an rssi uniformly
-        # distributed between friis and (friis - 40)
-        rssi = (
-            mu +
-            random.uniform(
-                -self.PISTER_HACK_LOWER_SHIFT/2,
-                +self.PISTER_HACK_LOWER_SHIFT/2
-            )
+        # distributed between friis and (friis - 40); drawn from the engine's
+        # random, unless another random generator is given
+        if generator is None:
+            generator = self.engine.random
+        return generator.uniform(
+            -self.PISTER_HACK_LOWER_SHIFT/2,
+            +self.PISTER_HACK_LOWER_SHIFT/2
         )
 
-        return rssi
+    def compute_rssi_matrix(self, src_motes, src_coordinates, dst_motes, dst_coordinates, variations=None):
+        """Compute the RSSIs from every src (rows) to every dst (columns)
 
-    def convert_rssi_to_pdr(self, rssi):
-        minRssi = min(self.RSSI_PDR_TABLE.keys())
-        maxRssi = max(self.RSSI_PDR_TABLE.keys())
+        Coordinates are arrays of (x, y) rows, in kilometers. 'variations' is
+        an array of the shape of the result, drawn by draw_rssi_variation()
+        row by row when not given. Same values as compute_rssi().
+        """
 
-        if rssi < minRssi:
-            pdr = 0.0
-        elif rssi > maxRssi:
-            pdr = 1.0
-        else:
-            floor_rssi = int(math.floor(rssi))
-            pdr_low    = self.RSSI_PDR_TABLE[floor_rssi]
-            pdr_high   = self.RSSI_PDR_TABLE[floor_rssi + 1]
-            # linear interpolation
-            pdr = (pdr_high - pdr_low) * (rssi - float(floor_rssi)) + pdr_low
-
-        assert pdr >= 0.0
-        assert pdr <= 1.0
-        return pdr
+        # distance in meters
+        dx       = dst_coordinates[numpy.newaxis, :, 0] - src_coordinates[:, numpy.newaxis, 0]
+        dy       = dst_coordinates[numpy.newaxis, :, 1] - src_coordinates[:, numpy.newaxis, 1]
+        distance = 1000 * numpy.sqrt(numpy.square(dx) + numpy.square(dy))
+
+        # sqrt and inverse of the free space path loss (fspl)
+        free_space_path_loss = (
+            self.SPEED_OF_LIGHT / (4 * math.pi * distance * self.TWO_DOT_FOUR_GHZ)
+        )
+
+        # simple friis equation in Pr = Pt + Gt + Gr + 20log10(fspl)
+        src_gain = numpy.array([m.radio.txPower + m.radio.antennaGain for m in src_motes])
+        dst_gain = numpy.array([m.radio.antennaGain for m in dst_motes])
+        pr = (
+            (src_gain[:, numpy.newaxis] + dst_gain[numpy.newaxis, :]) +
+            (20 * numpy.log10(free_space_path_loss))
+        )
+
+        # mean RSSI (== friis - 20)
+        mu = pr - self.PISTER_HACK_LOWER_SHIFT / 2
+
+        if variations is None:
+            variations = numpy.array(
+                [self.draw_rssi_variation() for _ in range(mu.size)]
+            ).reshape(mu.shape)
+
+        return mu + variations
+
+    def convert_rssi_to_pdr_matrix(self, rssis):
+        """Same as convert_rssi_to_pdr(), on an array of RSSIs"""
+        return rssi_to_pdr_array(rssis)
+
+    def compute_max_distance(self, gain):
+        """Compute the distance in kilometers beyond which the RSSI is always
+        below the lowest RSSI of RSSI_PDR_TABLE, i.e. the PDR is 0
+
+        'gain' is the transmit power plus the antenna gains, in dB.
+        """
+
+        # the highest RSSI is friis; solve friis == lowest RSSI of the table
+        min_rssi = RSSI_PDR_MIN
+        distance = (
+            self.SPEED_OF_LIGHT / (4 * math.pi * self.TWO_DOT_FOUR_GHZ) *
+            pow(10, (gain - min_rssi) / 20.0)
+        )
+        return distance / 1000
+
+    def convert_rssi_to_pdr(self, rssi):
+        return rssi_to_pdr(rssi)
 
     @staticmethod
     def _get_distance_in_meters(a, b):
@@ -29,7 +29,7 @@ import SimEngine
 
 class Mote(object):
 
-    def __init__(self, id):
+    def __init__(self, id, engine):
 
         # store params
         self.id                        = id
@@ -37,10 +37,10 @@ class Mote(object):
         # admin
         self.dataLock                  = threading.RLock()
 
-        # singletons (quicker access, instead of recreating every time)
-        self.log                       = SimEngine.SimLog.SimLog().log
-        self.engine                    = SimEngine.SimEngine.SimEngine()
-        self.settings                  = SimEngine.SimSettings.SimSettings()
+        # simulation context, shared by all the layers of the mote
+        self.engine                    = engine
+        self.settings                  = engine.settings
+        self.log                       = engine.log
 
         # stack state
         self.dagRoot                   = False
@@ -135,7 +135,10 @@ class Mote(object):
                     and
                     (type(self.sf) == sf.SchedulingFunctionMSF)
                     and
-                    len(self.tsch.getTxRxSharedCells(self.rpl.getPreferredParent())) == 0
+                    self.tsch.getNumCells(
+                        self.rpl.getPreferredParent(),
+                        [d.CELLOPTION_TX, d.CELLOPTION_RX, d.CELLOPTION_SHARED]
+                    ) == 0
                 ):
                     returnVal = False
 
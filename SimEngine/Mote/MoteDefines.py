@@ -93,6 +93,9 @@ TSCH_MAX_BACKOFF_EXPONENT                   = 7
 CELLOPTION_TX                               = 'TX'
 CELLOPTION_RX                               = 'RX'
 CELLOPTION_SHARED                           = 'SHARED'
+CELLOPTION_BIT_TX                           = 0x01 # bits of the cell options of a tsch.Cell
+CELLOPTION_BIT_RX                           = 0x02
+CELLOPTION_BIT_SHARED                       = 0x04
 INTRASLOTORDER_STARTSLOT                    = 0
 INTRASLOTORDER_PROPAGATE                    = 1
 INTRASLOTORDER_STACKTASKS                   = 2
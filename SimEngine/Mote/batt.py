@@ -23,10 +23,10 @@ class Batt(object):
         # store params
         self.mote            = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine          = SimEngine.SimEngine.SimEngine()
-        self.settings        = SimEngine.SimSettings.SimSettings()
-        self.log             = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access, shared by the whole mote)
+        self.engine          = mote.engine
+        self.settings        = mote.settings
+        self.log             = mote.log
 
         # local variables
         self.chargeConsumed  = 0 # charge consumed so far, in uC
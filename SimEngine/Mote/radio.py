@@ -27,10 +27,10 @@ class Radio(object):
         # store params
         self.mote                           = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine                         = SimEngine.SimEngine.SimEngine()
-        self.settings                       = SimEngine.SimSettings.SimSettings()
-        self.log                            = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access, shared by the whole mote)
+        self.engine                         = mote.engine
+        self.settings                       = mote.settings
+        self.log                            = mote.log
 
         # local variables
         self.onGoingBroadcast               = None
@@ -55,6 +55,7 @@ class Radio(object):
         # record the state of the radio
         self.state   = d.RADIO_STATE_TX
         self.channel = channel
+        self.engine.connectivity.transmitters[channel].add(self.mote.id)
 
         # record ongoing, for propagation model
         self.onGoingTransmission = {
@@ -65,8 +66,12 @@ class Radio(object):
         # remember whether frame is broadcast
         self.onGoingBroadcast = (packet['mac']['dstMac']==d.BROADCAST_ADDRESS)
 
+        # have the propagation model handle this slot
+        self.engine.connectivity.schedule_propagate()
+
     def txDone(self, isACKed):
         """end of tx slot"""
+        self.engine.connectivity.transmitters[self.channel].remove(self.mote.id)
         self.state = d.RADIO_STATE_OFF
         self.channel = None
 
@@ -98,11 +103,16 @@ class Radio(object):
         assert self.state != d.RADIO_STATE_RX
         self.state = d.RADIO_STATE_RX
         self.channel = channel
+        self.engine.connectivity.listeners[channel].add(self.mote.id)
+
+        # have the propagation model handle this slot
+        self.engine.connectivity.schedule_propagate()
 
     def rxDone(self, packet):
         """end of RX radio activity"""
 
         # switch radio state
+        self.engine.connectivity.listeners[self.channel].remove(self.mote.id)
         self.state   = d.RADIO_STATE_OFF
         self.channel = None
 
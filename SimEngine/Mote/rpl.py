@@ -11,7 +11,6 @@ note:
 
 # =========================== imports =========================================
 
-import random
 import math
 
 # Mote sub-modules
@@ -42,10 +41,10 @@ class Rpl(object):
         # store params
         self.mote                      = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine                    = SimEngine.SimEngine.SimEngine()
-        self.settings                  = SimEngine.SimSettings.SimSettings()
-        self.log                       = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access, shared by the whole mote)
+        self.engine                    = mote.engine
+        self.settings                  = mote.settings
+        self.log                       = mote.log
 
         # local variables
         self.of                        = RplOF0(self)
@@ -55,6 +54,10 @@ class Rpl(object):
             k        = self.DEFAULT_DIO_REDUNDANCY_CONSTANT,
             callback = self._send_DIO
         )
+        # the trickle timer takes the engine and the settings created last;
+        # hand it the ones of this mote
+        self.trickle_timer.engine      = self.engine
+        self.trickle_timer.settings    = self.settings
         self.parentChildfromDAOs       = {}      # dictionary containing parents of each node
         self._tx_stat                  = {}      # indexed by mote_id
         self.dis_mode = self._get_dis_mode()
@@ -299,7 +302,7 @@ class Rpl(object):
             asnDiff = 1
         else:
             asnDiff = int(math.ceil(
-                random.uniform(
+                self.engine.random.uniform(
                     0.8 * self.settings.rpl_daoPeriod,
                     1.2 * self.settings.rpl_daoPeriod
                 ) / self.settings.tsch_slotDuration)
@@ -521,11 +524,11 @@ class RplOF0(object):
             # we've not received DIOs from this neighbor; ignore the neighbor
             return
         elif (
-                (cell['neighbor'] == mac_addr)
+                (cell.neighbor == mac_addr)
                 and
-                (d.CELLOPTION_TX in cell['cellOptions'])
+                (cell.options & d.CELLOPTION_BIT_TX)
                 and
-                (d.CELLOPTION_SHARED not in cell['cellOptions'])
+                not (cell.options & d.CELLOPTION_BIT_SHARED)
             ):
             neighbor['numTx'] += 1
             if isACKed is True:
@@ -689,7 +692,7 @@ class RplOF0(object):
 
                 print('list of all neighbors after removing', self.preferred_parent, 'is:', sublist)
 
-                candidate = random.sample(sublist, 1) # select one neighbr randomly 
+                candidate = self.rpl.engine.random.sample(sublist, 1) # select one neighbr randomly 
 
                 # change to the new preferred parent
                 if self.preferred_parent is None:
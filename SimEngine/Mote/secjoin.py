@@ -5,7 +5,6 @@ Secure joining layer of a mote.
 # =========================== imports =========================================
 
 import copy
-import random
 
 # Mote sub-modules
 import MoteDefines as d
@@ -31,10 +30,10 @@ class SecJoin(object):
         # store params
         self.mote                           = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine                         = SimEngine.SimEngine.SimEngine()
-        self.settings                       = SimEngine.SimSettings.SimSettings()
-        self.log                            = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access, shared by the whole mote)
+        self.engine                         = mote.engine
+        self.settings                       = mote.settings
+        self.log                            = mote.log
 
         # local variables
         self._isJoined                      = False
@@ -88,7 +87,7 @@ class SecJoin(object):
 
             # initialize request timeout; pick a number randomly between
             # TIMEOUT_BASE and (TIMEOUT_BASE * TIMEOUT_RANDOM_FACTOR)
-            self._request_timeout  = self.TIMEOUT_BASE * random.uniform(1, self.TIMEOUT_RANDOM_FACTOR)
+            self._request_timeout  = self.TIMEOUT_BASE * self.engine.random.uniform(1, self.TIMEOUT_RANDOM_FACTOR)
 
             self._send_join_request()
         else:
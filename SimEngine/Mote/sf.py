@@ -1,6 +1,5 @@
 # =========================== imports =========================================
 
-import random
 import sys
 from abc import abstractmethod
 
@@ -15,7 +14,7 @@ import MoteDefines as d
 
 class SchedulingFunction(object):
     def __new__(cls, mote):
-        settings    = SimEngine.SimSettings.SimSettings()
+        settings    = mote.settings
         class_name  = 'SchedulingFunction{0}'.format(settings.sf_class)
         return getattr(sys.modules[__name__], class_name)(mote)
 
@@ -26,10 +25,10 @@ class SchedulingFunctionBase(object):
         # store params
         self.mote            = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.settings        = SimEngine.SimSettings.SimSettings()
-        self.engine          = SimEngine.SimEngine.SimEngine()
-        self.log             = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access, shared by the whole mote)
+        self.settings        = mote.settings
+        self.engine          = mote.engine
+        self.log             = mote.log
 
     # ======================= public ==========================================
 
@@ -143,10 +142,10 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
     # === indications from other layers
 
     def indication_dedicated_tx_cell_elapsed(self, cell, used):
-        assert cell['neighbor'] is not None
+        assert cell.neighbor is not None
 
         preferred_parent = self.mote.rpl.getPreferredParent()
-        if cell['neighbor'] == preferred_parent:
+        if cell.neighbor == preferred_parent:
 
             # HACK: we don't transmit a frame on a shared link if it
             # has a dedicated TX link to the destination and doesn't
@@ -156,9 +155,9 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             # from TX cells for this housekeeping when it has at least
             # one TX dedicate link.
             if (
-                    (len(self.mote.tsch.getTxCells(cell['neighbor'])) > 0)
+                    (self.mote.tsch.getNumCells(cell.neighbor, self.TX_CELL_OPT) > 0)
                     and
-                    (d.CELLOPTION_SHARED in cell['cellOptions'])
+                    (cell.options & d.CELLOPTION_BIT_SHARED)
                 ):
                 # ignore this TX/(RX)/SHARED cell for this housekeeping round
                 pass
@@ -185,8 +184,8 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             num_tx_cells = 0
             num_rx_cells = 0
         else:
-            num_tx_cells = len(self.mote.tsch.getTxCells(old_parent))
-            num_rx_cells = len(self.mote.tsch.getRxCells(old_parent))
+            num_tx_cells = self.mote.tsch.getNumCells(old_parent, self.TX_CELL_OPT)
+            num_rx_cells = self.mote.tsch.getNumCells(old_parent, self.RX_CELL_OPT)
         
         #*************************************************************************
         # use identity function to find the slotOffset, add a random value and make sue I don't have these slotoffsets in my schedules
@@ -200,7 +199,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         ParentlockedSlots = parent.sf.locked_slots
         
         while (slot in self.mote.tsch.schedule.keys()) or (slot in parent.tsch.schedule.keys()) or (slot in lockedSlots) or (slot in ParentlockedSlots): 
-            rand = random.randint(0, 100-self.mote.id)
+            rand = self.engine.random.randint(0, 100-self.mote.id)
             slot = rand+self.mote.id # I need create some randomness here and test if the selectd slotOffset already exists in the schedule keys
         
         selected_slot = slot
@@ -355,11 +354,11 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
 
         txQueue = self.mote.tsch.getTxQueue()
 
-        for i in range(len(txQueue)):
+        for pkt in txQueue.get_packets(old_parent):
             
-            if ( (txQueue[i]['type'] == 'DATA') and (txQueue[i]['mac']['dstMac'] == old_parent) and  (txQueue[i]['mac']['retriesLeft'] >0) ):
+            if ( (pkt['type'] == 'DATA') and  (pkt['mac']['retriesLeft'] >0) ):
                 
-                txQueue[i]['mac']['dstMac'] = new_parent # set the detMac to the new parent
+                txQueue.set_dstMac(pkt, new_parent) # set the detMac to the new parent
 
 
                 self.log(
@@ -585,7 +584,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
 
         elif cell_utilization < d.MSF_LIM_NUMCELLSUSED_LOW:
             # delete one *TX* cell
-            if len(self.mote.tsch.getTxCells(neighbor_id)) > 0:
+            if self.mote.tsch.getNumCells(neighbor_id, self.TX_CELL_OPT) > 0:
                 
                 # print('this delete cell is called inside adapt to traffic function between ', self.mote.id, neighbor_id)
                 self._request_deleting_cells(
@@ -626,14 +625,14 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         tx_cell_list = self.mote.tsch.getTxCells(preferred_parent)
         tx_cell_list = {
             slotOffset: cell for slotOffset, cell in tx_cell_list.items() if (
-                d.MSF_MIN_NUM_TX < cell['numTx']
+                d.MSF_MIN_NUM_TX < cell.numTx
             )
         }
 
         # collect PDRs of the TX cells
         def pdr(cell):
-            assert cell['numTx'] > 0
-            return cell['numTxAck'] / float(cell['numTx'])
+            assert cell.numTx > 0
+            return cell.numTxAck / float(cell.numTx)
         pdr_list = {
             slotOffset: pdr(cell) for slotOffset, cell in tx_cell_list.items()
         }
@@ -953,7 +952,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             # Do nothing: the unique cell is left as a guard cell
 
         else:
-            selected_keys=random.sample(cells, Nbr_cells-1)
+            selected_keys=self.engine.random.sample(cells, Nbr_cells-1)
             set_cells = {key: cells[key] for key in selected_keys}
       
             
@@ -1060,11 +1059,11 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             # we don't have enough available cells; no cell is selected
             selected_slots = []
         else:
-            selected_slots = random.sample(available_slots, cell_list_len)
+            selected_slots = self.engine.random.sample(available_slots, cell_list_len)
 
         cell_list = []
         for slot_offset in selected_slots:
-            channel_offset = random.randint(0, self.settings.phy_numChans - 1)
+            channel_offset = self.engine.random.randint(0, self.settings.phy_numChans - 1)
             cell_list.append(
                 {
                     'slotOffset'   : slot_offset,
@@ -1166,7 +1165,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
 
         
         if cell_list_len <= len(occupied_cells):# the original code
-            cell_list = random.sample(cell_list, cell_list_len) # the original code
+            cell_list = self.engine.random.sample(cell_list, cell_list_len) # the original code
 
 
 
@@ -1319,7 +1318,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
         if len(candidate_cells) < request['app']['numCells']:
             cell_list = candidate_cells
         else:
-            cell_list = random.sample(
+            cell_list = self.engine.random.sample(
                 candidate_cells,
                 request['app']['numCells']
             )
@@ -1505,7 +1504,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
                 (num_cells <= len(candidate_cell_list))
             ):
             code = d.SIXP_RC_SUCCESS
-            cell_list = random.sample(candidate_cell_list, num_cells)
+            cell_list = self.engine.random.sample(candidate_cell_list, num_cells)
 
             def callback(event, packet):
                 if event == d.SIXP_CALLBACK_EVENT_MAC_ACK_RECEPTION:
@@ -1689,7 +1688,7 @@ class SchedulingFunctionMSF(SchedulingFunctionBase):
             # prepare response
             code           = d.SIXP_RC_SUCCESS
             cell_list      = []
-            selected_slots = random.sample(available_slots, num_cells)
+            selected_slots = self.engine.random.sample(available_slots, num_cells)
             for cell in candidate_cells:
                 if cell['slotOffset'] in selected_slots:
                     cell_list.append(cell)
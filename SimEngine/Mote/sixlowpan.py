@@ -7,7 +7,6 @@
 from abc import abstractmethod
 import copy
 import math
-import random
 
 # Simulator-wide modules
 import SimEngine
@@ -28,10 +27,10 @@ class Sixlowpan(object):
         # store params
         self.mote                 = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.settings             = SimEngine.SimSettings.SimSettings()
-        self.engine               = SimEngine.SimEngine.SimEngine()
-        self.log                  = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access, shared by the whole mote)
+        self.settings             = mote.settings
+        self.engine               = mote.engine
+        self.log                  = mote.log
 
         # local variables
         self.fragmentation        = globals()[self.settings.fragmentation](self)
@@ -39,13 +38,6 @@ class Sixlowpan(object):
         # neighbor_cache: indexed by IPv6 address, maintain MAC addresses
         self.neighbor_cache       = {}
 
-        # # added Fadoua, this is how to declare a variable dictionary to be global
-        try:
-            _ = Nbr_DATA_pkts_crossing
-        except NameError:
-            global Nbr_DATA_pkts_crossing
-            Nbr_DATA_pkts_crossing = {}
-
 
     #======================== public ==========================================
 
@@ -157,6 +149,7 @@ class Sixlowpan(object):
     def count_DATA_pkts_motes_without_dedicated_cell(self, packet):
         # for quick access; get preferred parent
         neighbor_id = packet['mac']['srcMac']
+        Nbr_DATA_pkts_crossing = self.engine.dataPktsCrossing # shared by all the motes
         dedicated_cells = self.mote.tsch.getDedicatedCells(neighbor_id)
 
         if len(dedicated_cells) == 0: # if we don't have a dedicated cell yet
@@ -236,7 +229,7 @@ class Sixlowpan(object):
         cell={}
         if slotOffset in self.mote.tsch.getSchedule():
         
-            cell = schedule[slotOffset] 
+            cell = schedule[slotOffset].to_dict()
 
         # log
         self.log(
@@ -440,14 +433,14 @@ class Fragmentation(object):
         # store params
         self.sixlowpan            = sixlowpan
 
-        # singletons (quicker access, instead of recreating every time)
-        self.settings             = SimEngine.SimSettings.SimSettings()
-        self.engine               = SimEngine.SimEngine.SimEngine()
-        self.log                  = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access, shared by the whole mote)
+        self.settings             = sixlowpan.settings
+        self.engine               = sixlowpan.engine
+        self.log                  = sixlowpan.log
 
         # local variables
         self.mote                 = sixlowpan.mote
-        self.next_datagram_tag    = random.randint(0, 2**16-1)
+        self.next_datagram_tag    = self.engine.random.randint(0, 2**16-1)
         # "reassembly_buffers" has mote instances as keys. Each value is a list.
         # A list is indexed by incoming datagram_tags.
         #
@@ -33,10 +33,10 @@ class SixP(object):
         # store params
         self.mote                  = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine                = SimEngine.SimEngine.SimEngine()
-        self.settings              = SimEngine.SimSettings.SimSettings()
-        self.log                   = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access, shared by the whole mote)
+        self.engine                = mote.engine
+        self.settings              = mote.settings
+        self.log                   = mote.log
 
         # local variables
         self.seqnum_table          = {} # indexed by neighbor_id
@@ -559,9 +559,9 @@ class SixPTransaction(object):
 
         # keep external instances
         self.mote             = mote
-        self.engine           = SimEngine.SimEngine.SimEngine()
-        self.settings         = SimEngine.SimSettings.SimSettings()
-        self.log              = SimEngine.SimLog.SimLog().log
+        self.engine           = mote.engine
+        self.settings         = mote.settings
+        self.log              = mote.log
 
         # local variables
         self.request          = copy.deepcopy(request)
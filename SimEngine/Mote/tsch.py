@@ -3,8 +3,8 @@
 
 # =========================== imports =========================================
 
+import bisect
 import copy
-import random
 
 # Mote sub-modules
 import MoteDefines as d
@@ -14,8 +14,31 @@ import SimEngine
 
 # =========================== defines =========================================
 
+# cell options and their bits, in the order of the cell options lists
+CELLOPTION_BITS = [
+    (d.CELLOPTION_TX,     d.CELLOPTION_BIT_TX),
+    (d.CELLOPTION_RX,     d.CELLOPTION_BIT_RX),
+    (d.CELLOPTION_SHARED, d.CELLOPTION_BIT_SHARED),
+]
+
 # =========================== helpers =========================================
 
+def get_cell_options_bits(cellOptions):
+    """Convert a list of cell options into their bits"""
+    bits = 0
+    for (cellOption, bit) in CELLOPTION_BITS:
+        if cellOption in cellOptions:
+            bits |= bit
+    return bits
+
+def get_cell_options_list(bits):
+    """Convert bits of cell options into their list"""
+    return [cellOption for (cellOption, bit) in CELLOPTION_BITS if bits & bit]
+
+CELLOPTIONS_MINIMAL = get_cell_options_bits(
+    [d.CELLOPTION_TX, d.CELLOPTION_RX, d.CELLOPTION_SHARED]
+)
+
 # =========================== body ============================================
 
 class Tsch(object):
@@ -33,14 +56,21 @@ class Tsch(object):
         # store params
         self.mote                           = mote
 
-        # singletons (quicker access, instead of recreating every time)
-        self.engine                         = SimEngine.SimEngine.SimEngine()
-        self.settings                       = SimEngine.SimSettings.SimSettings()
-        self.log                            = SimEngine.SimLog.SimLog().log
+        # simulation context (quicker access, shared by the whole mote)
+        self.engine                         = mote.engine
+        self.settings                       = mote.settings
+        self.log                            = mote.log
 
         # local variables
         self.schedule                       = {}      # indexed by slotOffset, contains cell
-        self.txQueue                        = []
+        # indexes of the schedule, maintained by _add_cell_to_schedule() and
+        # _delete_cell_from_schedule(); each contains the cells (indexed by
+        # slotOffset) of a neighbor, of a set of cell options, or of both
+        self.cells_by_neighbor              = {}      # indexed by neighbor
+        self.cells_by_options               = {}      # indexed by options key
+        self.cells_by_neighbor_options      = {}      # indexed by (neighbor, options key)
+        self.active_slots                   = []      # sorted slotOffsets of the schedule
+        self.txQueue                        = TxQueue()
         self.neighbor_table                  = []
         self.pktToSend                      = None
         self.waitingFor                     = None
@@ -62,6 +92,17 @@ class Tsch(object):
     def getSchedule(self):
         return self.schedule
 
+    @property
+    def txQueue(self):
+        return self._txQueue
+
+    @txQueue.setter
+    def txQueue(self, packets):
+        # a list of packets can be assigned to the TX queue
+        if not isinstance(packets, TxQueue):
+            packets = TxQueue(packets)
+        self._txQueue = packets
+
     def getTxQueue(self):
         return self.txQueue
 
@@ -121,24 +162,13 @@ class Tsch(object):
         :param cellOptions:
         :rtype: dict
         """
-        if neighbor is not None:
-            assert type(neighbor) == int
-
-        # configure filtering condition
-        if (neighbor is None) and (cellOptions is not None):    # filter by cellOptions
-            condition = lambda (_, c): sorted(c['cellOptions']) == sorted(cellOptions)
-        elif (neighbor is not None) and (cellOptions is None):  # filter by neighbor
-            condition = lambda (_, c): c['neighbor'] == neighbor
-        elif (neighbor is None) and (cellOptions is None):      # don't filter
-            condition = lambda (_, c): True
-        else:                                                   # filter by cellOptions and neighbor
-            condition = lambda (_, c): (
-                    sorted(c['cellOptions']) == sorted(cellOptions) and
-                    c['neighbor'] == neighbor
-            )
+        return dict(self._get_indexed_cells(neighbor, cellOptions))
 
-        # apply filter
-        return dict(filter(condition, self.schedule.items()))
+    def getNumCells(self, neighbor=None, cellOptions=None):
+        """
+        Returns the number of cells _getCells() would return, in constant time
+        """
+        return len(self._get_indexed_cells(neighbor, cellOptions))
 
     def getTxCells(self, neighbor=None):
         return self._getCells(
@@ -232,15 +262,14 @@ class Tsch(object):
 
         # add cell
         # Fadoua: here is where the actual adding of the cell happen
-        self.schedule[slotOffset] = {
-            'channelOffset':      channelOffset,
-            'neighbor':           neighbor,
-            'cellOptions':        cellOptions,
-            # per-cell statistics
-            'numTx':              0,
-            'numTxAck':           0,
-            'numRx':              0,
-        }
+        self._add_cell_to_schedule(
+            slotOffset,
+            Cell(
+                channelOffset = channelOffset,
+                neighbor      = neighbor,
+                options       = get_cell_options_bits(cellOptions),
+            )
+        )
 
         # reschedule the next active cell, in case it is now earlier
         if self.getIsSync():
@@ -271,7 +300,7 @@ class Tsch(object):
 
             assert self.schedule[slotOffset]['channelOffset']  == channelOffset
             assert self.schedule[slotOffset]['neighbor']       == neighbor
-            assert self.schedule[slotOffset]['cellOptions']    == cellOptions
+            assert self.schedule[slotOffset].options           == get_cell_options_bits(cellOptions)
 
             lockedSlots= list (self.mote.sf.locked_slots)
 
@@ -305,7 +334,7 @@ class Tsch(object):
         
             # if simply delete the minimal cell
             if(reason == "minimal cell"):
-                del self.schedule[slotOffset]
+                self._delete_cell_from_schedule(slotOffset)
 
             else:
 
@@ -330,13 +359,13 @@ class Tsch(object):
                         if (len(list_cell_to_neighbor) <= 1):
                             pass
                         else:
-                            del self.schedule[slotOffset]
+                            self._delete_cell_from_schedule(slotOffset)
 
                     elif ((pp == self.mote.id) and (len(list_cell_to_neighbor) <= 1)): # the current preferred parent of source is the root and we have only one dedicated cell -- do not supress it
                         pass       
                     
                     else:
-                        del self.schedule[slotOffset]
+                        self._delete_cell_from_schedule(slotOffset)
 
                 # not a DAG root
                 else:
@@ -390,18 +419,13 @@ class Tsch(object):
         
         source= self.engine.motes[neighbor]
         txQueue = source.tsch.getTxQueue()
-        
-        i=0
-        
+
         pending_DATA_pkts = False
-                
-        while (i<len(txQueue) and (pending_DATA_pkts == False)):    
 
-            if (txQueue[i]['type'] == 'DATA') and (txQueue[i]['mac']['dstMac'] == self.mote.id) and  (txQueue[i]['mac']['retriesLeft'] >= 0):
+        for pkt in txQueue.get_packets(self.mote.id):
+            if (pkt['type'] == 'DATA') and (pkt['mac']['retriesLeft'] >= 0):
                 pending_DATA_pkts = True
-            else:
-                pending_DATA_pkts = False 
-            i += 1 
+                break
 
         return (pending_DATA_pkts)
 
@@ -442,29 +466,29 @@ class Tsch(object):
                     pass
                 
                 elif (SourcePreferredParent == self.mote.id):
-                    if ((d.CELLOPTION_SHARED in cell['cellOptions']) and (len(shared_cells) <= 1 )):
+                    if ((cell.options & d.CELLOPTION_BIT_SHARED) and (len(shared_cells) <= 1 )):
                         resultat = 'not deleted'
                         cause = 'shared slot and routing loop mote is pref p of neighbor'
                         pass
                     else:
-                        del self.schedule[slotOffset]
+                        self._delete_cell_from_schedule(slotOffset)
                         resultat = 'deleted'
                         cause = 'no loops and tab size more than one'
                         # print('cell deleted successfully from', self.mote.id, 'to neighbor', neighbor)
                 
                 elif (self.mote.rpl.getPreferredParent() == neighbor):
-                    if ((d.CELLOPTION_SHARED in cell['cellOptions']) and (len(shared_cells) <= 1 )):
+                    if ((cell.options & d.CELLOPTION_BIT_SHARED) and (len(shared_cells) <= 1 )):
                         resultat = 'not deleted'
                         cause = 'shared slot and routing loop neighbor is pref p of mote'
                         pass
                     else:
-                        del self.schedule[slotOffset]
+                        self._delete_cell_from_schedule(slotOffset)
                         resultat = 'deleted'
                         cause = 'no loops and tab size more than one'
                         # print('cell deleted successfully from', self.mote.id, 'to neighbor', neighbor)
 
                 else:
-                    del self.schedule[slotOffset]
+                    self._delete_cell_from_schedule(slotOffset)
                     resultat = 'deleted'
                     cause = 'no loops and tab size more than one'
                     # print('cell deleted successfully from', self.mote.id, 'to neighbor', neighbor)
@@ -485,12 +509,12 @@ class Tsch(object):
                 pass
             else:
                 cell = self.schedule[slotOffset]
-                if ((d.CELLOPTION_SHARED in cell['cellOptions']) and (len(shared_cells) <= 1 )):
+                if ((cell.options & d.CELLOPTION_BIT_SHARED) and (len(shared_cells) <= 1 )):
                     resultat = 'not deleted'
                     cause = 'shared slot and routing loop mote is pref p of neighbor'
                     pass
                 else:
-                    del self.schedule[slotOffset]
+                    self._delete_cell_from_schedule(slotOffset)
                     resultat = 'deleted'
                     cause = 'no loops, no pending data and tab size more than one'
                     # print('cell deleted successfully from', self.mote.id, 'to neighbor', neighbor)
@@ -503,12 +527,12 @@ class Tsch(object):
                 pass
             else:
                 cell = self.schedule[slotOffset]
-                if ((d.CELLOPTION_SHARED in cell['cellOptions']) and (len(shared_cells) <= 1 )):
+                if ((cell.options & d.CELLOPTION_BIT_SHARED) and (len(shared_cells) <= 1 )):
                     resultat = 'not deleted'
                     cause = 'shared slot and routing loop mote is pref p of neighbor'
                     pass
                 else:
-                    del self.schedule[slotOffset]
+                    self._delete_cell_from_schedule(slotOffset)
                     resultat = 'deleted'
                     cause = 'no loops, no pending data and tab size more than one'
                     # print('cell deleted successfully from', self.mote.id, 'to neighbor', neighbor)
@@ -522,7 +546,7 @@ class Tsch(object):
                 cause = 'locked slot'
                 pass
             else:
-                del self.schedule[slotOffset]
+                self._delete_cell_from_schedule(slotOffset)
                 resultat = 'deleted'
                 cause = 'no loops, no pending data and tab size more than one'
                 # print('cell deleted successfully from', self.mote.id, 'to neighbor', neighbor)
@@ -586,7 +610,11 @@ class Tsch(object):
             
 
 
-            if (not self.getTxCells()) and (not self.getTxRxSharedCells()):
+            if (
+                    (self.getNumCells(cellOptions=[d.CELLOPTION_TX]) == 0)
+                    and
+                    (self.getNumCells(cellOptions=[d.CELLOPTION_TX, d.CELLOPTION_RX, d.CELLOPTION_SHARED]) == 0)
+                ):
                 # I don't have any cell to transmit on
 
                 # drop
@@ -606,7 +634,7 @@ class Tsch(object):
                 self.txQueue.insert(0, packet)
             else:
                 # add to txQueue
-                self.txQueue    += [packet]
+                self.txQueue.append(packet)
 
         return goOn
 
@@ -620,7 +648,7 @@ class Tsch(object):
         cell       = self.schedule[slotOffset]
 
         assert slotOffset in self.getSchedule()
-        assert d.CELLOPTION_TX in cell['cellOptions']
+        assert cell.options & d.CELLOPTION_BIT_TX
         assert self.waitingFor == d.WAITING_FOR_TX
 
         # log
@@ -644,7 +672,7 @@ class Tsch(object):
                 
                 'NbrOfCells':     len(self.schedule.keys()),# added Fadoua 
                 'TSCH_schedule':  otherC,# added Fadoua 
-                'selectedCell':   self.schedule[slotOffset], # added Fadoua 
+                'selectedCell':   self.schedule[slotOffset].to_dict(), # added Fadoua 
                 '_mote_id':       self.mote.id,
                 'channel':        self.channel,
                 'packet':         self.pktToSend,
@@ -682,7 +710,7 @@ class Tsch(object):
             # update the backoff exponent
             self._update_backoff_state(
                 isRetransmission = self._is_retransmission(self.pktToSend),
-                isSharedLink     = d.CELLOPTION_SHARED in cell['cellOptions'],
+                isSharedLink     = bool(cell.options & d.CELLOPTION_BIT_SHARED),
                 isTXSuccess      = isACKed
             )
 
@@ -690,7 +718,7 @@ class Tsch(object):
                 # ... which was ACKed
 
                 # update schedule stats
-                cell['numTxAck'] += 1
+                cell.numTxAck += 1
 
                 # time correction
                 if self.clock.source == self.pktToSend['mac']['dstMac']: # this must be for a keep alive pckt because it is the one which dstMac=self.clock.source: Fadoua
@@ -730,16 +758,10 @@ class Tsch(object):
         asn        = self.engine.getAsn()
         slotOffset = asn % self.settings.tsch_slotframeLength
 
-        # copy the received packet to a new packet instance since the passed
-        # "packet" should be kept as it is so that Connectivity can use it
-        # after this rxDone() process.
-        new_packet = copy.deepcopy(packet)
-        packet = new_packet
-
         # make sure I'm in the right state
         if self.getIsSync():
             assert slotOffset in self.getSchedule()
-            assert d.CELLOPTION_RX in self.getSchedule()[slotOffset]['cellOptions']
+            assert self.getSchedule()[slotOffset].options & d.CELLOPTION_BIT_RX
             assert self.waitingFor == d.WAITING_FOR_RX
 
         # not waiting for anything anymore
@@ -757,6 +779,14 @@ class Tsch(object):
         if packet['mac']['dstMac'] not in [d.BROADCAST_ADDRESS, self.mote.id]:
             return False # isACKed
 
+        # the passed "packet" is shared by all the listeners of the frame and
+        # should be kept as it is so that Connectivity can use it after this
+        # rxDone() process. The upper layers only read broadcast frames (EBs,
+        # DIOs), but they may modify or keep a unicast frame (forwarding,
+        # fragments, 6P): copy it to a new packet instance.
+        if packet['mac']['dstMac'] == self.mote.id:
+            packet = copy.deepcopy(packet)
+
         # if I get here, I received a frame at the link layer (either unicast for me, or broadcast)
 
         
@@ -784,7 +814,7 @@ class Tsch(object):
 
         # update schedule stats
         if self.getIsSync():
-            self.getSchedule()[slotOffset]['numRx'] += 1
+            self.getSchedule()[slotOffset].numRx += 1
 
         if   packet['mac']['dstMac'] == self.mote.id:
             # link-layer unicast to me
@@ -824,23 +854,65 @@ class Tsch(object):
         return isACKed
 
     def remove_frame_from_tx_queue(self, type, dstMac=None):
-        i = 0
-        while i<len(self.txQueue):
-            if (
-                    (self.txQueue[i]['type'] == type)
-                    and
-                    (
-                        (dstMac is None)
-                        or
-                        (self.txQueue[i]['mac']['dstMac'] == dstMac)
-                    )
-                ):
-                del self.txQueue[i]
-            else:
-                i += 1
+        if dstMac is None:
+            packets = list(self.txQueue)
+        else:
+            packets = self.txQueue.get_packets(dstMac)
+        for packet in packets:
+            if packet['type'] == type:
+                self.txQueue.remove_packet(packet)
 
     #======================== private ==========================================
 
+    # schedule indexes
+
+    @staticmethod
+    def _get_options_key(cellOptions):
+        # cell options compare as sets
+        return get_cell_options_bits(cellOptions)
+
+    def _get_indexed_cells(self, neighbor, cellOptions):
+        # the cells of neighbor with cellOptions, None meaning "any"; don't
+        # modify the returned dict
+        if neighbor is not None:
+            assert type(neighbor) == int
+
+        if   (neighbor is None) and (cellOptions is not None):  # filter by cellOptions
+            cells = self.cells_by_options.get(self._get_options_key(cellOptions))
+        elif (neighbor is not None) and (cellOptions is None):  # filter by neighbor
+            cells = self.cells_by_neighbor.get(neighbor)
+        elif (neighbor is None) and (cellOptions is None):      # don't filter
+            cells = self.schedule
+        else:                                                   # filter by cellOptions and neighbor
+            cells = self.cells_by_neighbor_options.get(
+                (neighbor, self._get_options_key(cellOptions))
+            )
+
+        if cells is None:
+            cells = {}
+        return cells
+
+    def _get_cell_indexes(self, cell):
+        return [
+            (self.cells_by_neighbor,         cell.neighbor),
+            (self.cells_by_options,          cell.options),
+            (self.cells_by_neighbor_options, (cell.neighbor, cell.options)),
+        ]
+
+    def _add_cell_to_schedule(self, slotOffset, cell):
+        self.schedule[slotOffset] = cell
+        bisect.insort(self.active_slots, slotOffset)
+        for (index, key) in self._get_cell_indexes(cell):
+            index.setdefault(key, {})[slotOffset] = cell
+
+    def _delete_cell_from_schedule(self, slotOffset):
+        cell = self.schedule.pop(slotOffset)
+        del self.active_slots[bisect.bisect_left(self.active_slots, slotOffset)]
+        for (index, key) in self._get_cell_indexes(cell):
+            del index[key][slotOffset]
+            if not index[key]:
+                del index[key]
+
     # listeningForEB
 
     def tsch_schedule_next_listeningForEB_cell(self):
@@ -863,7 +935,7 @@ class Tsch(object):
         assert not self.getIsSync()
 
         # choose random channel
-        channel = random.randint(0, self.settings.phy_numChans-1)
+        channel = self.engine.random.randint(0, self.settings.phy_numChans-1)
 
         # start listening
         self.mote.radio.startRx(
@@ -892,20 +964,13 @@ class Tsch(object):
             self.engine.removeFutureEvent(uniqueTag=(self.mote.id, '_tsch_action_active_cell'))
             return
 
-        tsDiffMin             = None
-
-        for (slotOffset, cell) in self.schedule.items():
-            if   slotOffset == tsCurrent:
-                tsDiff        = self.settings.tsch_slotframeLength
-            elif slotOffset > tsCurrent:
-                tsDiff        = slotOffset-tsCurrent
-            elif slotOffset < tsCurrent:
-                tsDiff        = (slotOffset+self.settings.tsch_slotframeLength)-tsCurrent
-            else:
-                raise SystemError()
-
-            if (not tsDiffMin) or (tsDiff < tsDiffMin):
-                tsDiffMin     = tsDiff
+        # first active slot after the current one, in this slotframe or else
+        # in the next one (possibly the current slot)
+        index                 = bisect.bisect_right(self.active_slots, tsCurrent)
+        if index < len(self.active_slots):
+            tsDiffMin         = self.active_slots[index]-tsCurrent
+        else:
+            tsDiffMin         = (self.active_slots[0]+self.settings.tsch_slotframeLength)-tsCurrent
 
         # schedule at that ASN
         self.engine.scheduleAtAsn(
@@ -939,9 +1004,9 @@ class Tsch(object):
         assert self.pktToSend == None
 
         # execute cell
-        if cell['neighbor'] is None:
+        if cell.neighbor is None:
             # on a shared cell
-            if sorted(cell['cellOptions']) == sorted([d.CELLOPTION_TX,d.CELLOPTION_RX,d.CELLOPTION_SHARED]):
+            if cell.options == CELLOPTIONS_MINIMAL:
                 # on minimal cell
                 # try to find a packet to neighbor to which I don't have any dedicated cell(s)...
                 if not self.pktToSend:
@@ -954,9 +1019,9 @@ class Tsch(object):
                                 or
                                 # other frames on the minimal cell if no dedicated cells to the nextHop
                                 (
-                                    len(self.getTxCells(pkt['mac']['dstMac'])) == 0
+                                    self.getNumCells(pkt['mac']['dstMac'], [d.CELLOPTION_TX]) == 0
                                     and
-                                    len(self.getTxRxSharedCells(pkt['mac']['dstMac'])) == 0
+                                    self.getNumCells(pkt['mac']['dstMac'], [d.CELLOPTION_TX, d.CELLOPTION_RX, d.CELLOPTION_SHARED]) == 0
                                 )
                             ):
                             self.pktToSend = pkt
@@ -982,7 +1047,7 @@ class Tsch(object):
                     if self.mote.clear_to_send_EBs_DATA():
                         prob = self.settings.tsch_probBcast_ebProb/(1+len(self.neighbor_table))
                         if (
-                                (random.random() < prob)
+                                (self.engine.random.random() < prob)
                                 and
                                 (self.iAmSendingEBs)
                             ):
@@ -1002,21 +1067,17 @@ class Tsch(object):
             # on a dedicated cell
 
             # find a possible pktToSend first
-            _pktToSend = None
-            for pkt in self.txQueue:
-                if pkt['mac']['dstMac'] == cell['neighbor']:
-                    _pktToSend = pkt
-                    break
+            _pktToSend = self.txQueue.get_first_packet(cell.neighbor)
             # HACK: don't transmit a frame on a shared link if it has a
             # dedicated TX link to the destination and doesn't have a
             # dedicated RX link from the destination. In such a case, the
             # shared link is used as if it's a dedicated RX.
             if (
-                    (d.CELLOPTION_SHARED in cell['cellOptions'])
+                    (cell.options & d.CELLOPTION_BIT_SHARED)
                     and
-                    (len(self.getTxCells(cell['neighbor'])) > 0)
+                    (self.getNumCells(cell.neighbor, [d.CELLOPTION_TX]) > 0)
                     and
-                    (len(self.getRxCells(cell['neighbor'])) == 0)
+                    (self.getNumCells(cell.neighbor, [d.CELLOPTION_RX]) == 0)
                 ):
                 _pktToSend = None
 
@@ -1024,7 +1085,7 @@ class Tsch(object):
             if (
                     (_pktToSend is not None)
                     and
-                    (d.CELLOPTION_SHARED in cell['cellOptions'])
+                    (cell.options & d.CELLOPTION_BIT_SHARED)
                     and
                     self._is_retransmission(_pktToSend)
                 ):
@@ -1040,13 +1101,13 @@ class Tsch(object):
             if (
                     (_pktToSend is not None)
                     and
-                    (d.CELLOPTION_TX in cell['cellOptions'])
+                    (cell.options & d.CELLOPTION_BIT_TX)
                 ):
                 # we're going to transmit the packet
                 self.pktToSend = _pktToSend
                 self._tsch_action_TX(self.pktToSend)
 
-            elif d.CELLOPTION_RX in cell['cellOptions']:
+            elif cell.options & d.CELLOPTION_BIT_RX:
                 # receive
                 self._tsch_action_RX()
             else:
@@ -1054,7 +1115,7 @@ class Tsch(object):
                 pass
 
             # notify SF
-            if d.CELLOPTION_TX in cell['cellOptions']:
+            if cell.options & d.CELLOPTION_BIT_TX:
                 self.mote.sf.indication_dedicated_tx_cell_elapsed(
                     cell    = cell,
                     used    = (self.pktToSend is not None),
@@ -1071,25 +1132,25 @@ class Tsch(object):
         cell       = self.schedule[slotOffset]
 
         # update cell stats
-        cell['numTx'] += 1
+        cell.numTx += 1
 
         # Seciton 4.3 of draft-chang-6tisch-msf-01: "When NumTx reaches 256,
         # both NumTx and NumTxAck MUST be divided by 2.  That is, for example,
         # from NumTx=256 and NumTxAck=128, they become NumTx=128 and
         # NumTxAck=64."
-        if cell['numTx'] == 256:
-            cell['numTx']    /= 2
-            cell['numTxAck'] /= 2
+        if cell.numTx == 256:
+            cell.numTx    /= 2
+            cell.numTxAck /= 2
 
         # send packet to the radio
         self.mote.radio.startTx(
-            channel          = cell['channelOffset'],
+            channel          = cell.channelOffset,
             packet           = pktToSend,
         )
 
         # indicate that we're waiting for the TX operation to finish
         self.waitingFor      = d.WAITING_FOR_TX
-        self.channel         = cell['channelOffset']
+        self.channel         = cell.channelOffset
 
 
         # if (pktToSend['type']== 'DATA'):
@@ -1104,12 +1165,12 @@ class Tsch(object):
 
         # start listening
         self.mote.radio.startRx(
-            channel          = cell['channelOffset'],
+            channel          = cell.channelOffset,
         )
 
         # indicate that we're waiting for the RX operation to finish
         self.waitingFor      = d.WAITING_FOR_RX
-        self.channel         = cell['channelOffset']
+        self.channel         = cell.channelOffset
 
     # EBs
 
@@ -1180,7 +1241,7 @@ class Tsch(object):
         # Section 6.2.5.3 of IEEE 802.15.4-2015: "The MAC sublayer shall delay
         # for a random number in the range 0 to (2**BE - 1) shared links (on
         # any slotframe) before attempting a retransmission on a shared link."
-        self.backoff_remaining_delay = random.randint(
+        self.backoff_remaining_delay = self.engine.random.randint(
             0,
             pow(2, self.backoff_exponent) - 1
         )
@@ -1331,11 +1392,217 @@ class Tsch(object):
         return '{0}-{1}'.format(self.mote.id, 'tsch.keep_alive_event')
 
 
+class Cell(object):
+    """
+    Cell of a TSCH schedule, at the slotOffset indexing it
+
+    The cell options are bits (CELLOPTION_BIT_*). The cell can be read and
+    written as a dict whose 'cellOptions' is the list of its cell options.
+    'neighbor' and 'cellOptions' index the schedule, and are read-only: to
+    change them, delete the cell and add a new one.
+    """
+
+    __slots__      = ['channelOffset', 'neighbor', 'options', 'numTx', 'numTxAck', 'numRx']
+
+    KEYS           = ['channelOffset', 'neighbor', 'cellOptions', 'numTx', 'numTxAck', 'numRx']
+    READ_ONLY_KEYS = ['neighbor', 'cellOptions']
+
+    def __init__(self, channelOffset, neighbor, options):
+        self.channelOffset = channelOffset
+        self.neighbor      = neighbor      # None means "any"
+        self.options       = options
+        # per-cell statistics
+        self.numTx         = 0
+        self.numTxAck      = 0
+        self.numRx         = 0
+
+    @property
+    def cellOptions(self):
+        return get_cell_options_list(self.options)
+
+    def to_dict(self):
+        return dict((key, self[key]) for key in self.KEYS)
+
+    # dict interface
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key in self.READ_ONLY_KEYS:
+            raise TypeError('{0} of a scheduled cell is read-only'.format(key))
+        elif key in self.KEYS:
+            setattr(self, key, value)
+        else:
+            raise KeyError(key)
+
+    def __repr__(self):
+        return 'Cell({0})'.format(self.to_dict())
+
+class TxQueue(list):
+    """
+    TX queue: the list of the queued packets, in transmission order, indexed
+    by destination MAC address
+
+    Each queued packet has an order key, increasing along the queue; the
+    per-destination lists are kept sorted by key, and a packet is found in
+    them, and in the queue, by bisection. A packet is queued at most once.
+    Change the destination of a queued packet with set_dstMac().
+    """
+
+    def __init__(self, packets=()):
+        super(TxQueue, self).__init__(packets)
+        self._reindex()
+
+    def __reduce__(self):
+        return (TxQueue, (list(self),))
+
+    # per-destination access
+
+    def get_first_packet(self, dstMac):
+        packets = self.packets_by_dstMac.get(dstMac)
+        if packets:
+            return packets[0]
+        else:
+            return None
+
+    def get_packets(self, dstMac):
+        return list(self.packets_by_dstMac.get(dstMac, []))
+
+    def set_dstMac(self, packet, dstMac):
+        self._remove_from_index(packet)
+        packet['mac']['dstMac'] = dstMac
+        self._add_to_index(packet)
+
+    def remove_packet(self, packet):
+        # remove that very packet, where remove() removes the first equal one
+        if id(packet) not in self.keys:
+            raise ValueError('packet not in TX queue')
+        self.pop(self._bisect(self, self.keys[id(packet)]))
+
+    # list interface
+
+    def append(self, packet):
+        self.last_key += 1
+        self.keys[id(packet)] = self.last_key
+        super(TxQueue, self).append(packet)
+        self.packets_by_dstMac.setdefault(self._get_dstMac(packet), []).append(packet)
+
+    def extend(self, packets):
+        for packet in packets:
+            self.append(packet)
+
+    def __iadd__(self, packets):
+        self.extend(packets)
+        return self
+
+    def insert(self, index, packet):
+        # same index as list.insert()
+        if index < 0:
+            index = max(index + len(self), 0)
+        if index >= len(self):
+            self.append(packet)
+            return
+
+        if index == 0:
+            self.first_key -= 1
+            key = self.first_key
+        else:
+            key = (self.keys[id(self[index - 1])] + self.keys[id(self[index])]) / 2.0
+            if not (self.keys[id(self[index - 1])] < key < self.keys[id(self[index])]):
+                # no key left between the neighbors: number the queue again
+                super(TxQueue, self).insert(index, packet)
+                self._reindex()
+                return
+        self.keys[id(packet)] = key
+        super(TxQueue, self).insert(index, packet)
+        self._add_to_index(packet)
+
+    def pop(self, index=-1):
+        packet = super(TxQueue, self).pop(index)
+        self._remove_from_index(packet)
+        del self.keys[id(packet)]
+        return packet
+
+    def remove(self, packet):
+        self.pop(self.index(packet))
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            super(TxQueue, self).__delitem__(index)
+            self._reindex()
+        else:
+            self.pop(index)
+
+    def __setitem__(self, index, packet):
+        super(TxQueue, self).__setitem__(index, packet)
+        self._reindex()
+
+    def __delslice__(self, i, j):
+        super(TxQueue, self).__delslice__(i, j)
+        self._reindex()
+
+    def __setslice__(self, i, j, packets):
+        super(TxQueue, self).__setslice__(i, j, packets)
+        self._reindex()
+
+    def sort(self, *args, **kwargs):
+        super(TxQueue, self).sort(*args, **kwargs)
+        self._reindex()
+
+    def reverse(self):
+        super(TxQueue, self).reverse()
+        self._reindex()
+
+    # private
+
+    @staticmethod
+    def _get_dstMac(packet):
+        if 'mac' in packet:
+            return packet['mac']['dstMac']
+        else:
+            return None
+
+    def _bisect(self, packets, key):
+        # index of the first packet of 'packets', sorted by key, whose key is
+        # not lower than 'key'
+        (low, high) = (0, len(packets))
+        while low < high:
+            middle = (low + high) // 2
+            if self.keys[id(packets[middle])] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _reindex(self):
+        self.keys              = {} # order key, indexed by id(packet)
+        self.first_key         = 0
+        self.last_key          = -1
+        self.packets_by_dstMac = {}
+        for packet in self:
+            self.last_key += 1
+            self.keys[id(packet)] = self.last_key
+            self.packets_by_dstMac.setdefault(self._get_dstMac(packet), []).append(packet)
+
+    def _add_to_index(self, packet):
+        packets = self.packets_by_dstMac.setdefault(self._get_dstMac(packet), [])
+        packets.insert(self._bisect(packets, self.keys[id(packet)]), packet)
+
+    def _remove_from_index(self, packet):
+        dstMac  = self._get_dstMac(packet)
+        packets = self.packets_by_dstMac[dstMac]
+        del packets[self._bisect(packets, self.keys[id(packet)])]
+        if not packets:
+            del self.packets_by_dstMac[dstMac]
+
 class Clock(object):
     def __init__(self, mote):
-        # singleton
-        self.engine   = SimEngine.SimEngine.SimEngine()
-        self.settings = SimEngine.SimSettings.SimSettings()
+        # simulation context
+        self.engine   = mote.engine
+        self.settings = mote.settings
 
         # local variables
         self.mote = mote
@@ -1349,10 +1616,8 @@ class Clock(object):
 
         self.desync()
 
-    @staticmethod
-    def get_clock_by_mote_id(mote_id):
-        engine = SimEngine.SimEngine.SimEngine()
-        mote = engine.get_mote_by_id(mote_id)
+    def get_clock_by_mote_id(self, mote_id):
+        mote = self.engine.get_mote_by_id(mote_id)
         return mote.tsch.clock
 
     def desync(self):
@@ -1376,7 +1641,7 @@ class Clock(object):
             # from the clock source when 32.768 Hz oscillators are used on the
             # both sides. in addition, the clock source also off from a certain
             # amount of time from its source.
-            off_from_source = random.random() * self._clock_interval
+            off_from_source = self.engine.random.random() * self._clock_interval
             source_clock = self.get_clock_by_mote_id(self.source)
             self._clock_off_on_sync = off_from_source + source_clock.get_drift()
 
@@ -1416,4 +1681,4 @@ class Clock(object):
         max_drift = (
             float(self.settings.tsch_clock_max_drift_ppm) / pow(10, 6)
         )
-        return random.uniform(-1 * max_drift * 2, max_drift * 2)
+        return self.engine.random.uniform(-1 * max_drift * 2, max_drift * 2)
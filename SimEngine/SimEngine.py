@@ -4,92 +4,101 @@
 
 # ========================== imports =========================================
 
+import contextlib
+import cPickle
 import hashlib
+import heapq
+import itertools
+import marshal
+import os
 import platform
 import random
 import sys
 import threading
 import time
 import traceback
+import types
 
 import Mote
-import SimSettings
 import SimLog
 import Connectivity
 import SimConfig
 
 # =========================== defines =========================================
 
-# =========================== body ============================================
+PROGRESS_PERIOD = 1.0 # min. wall-clock time between two progress reports, in s
 
-class DiscreteEventEngine(threading.Thread):
-    
-    #===== start singleton
-    _instance      = None
-    _init          = False
+# =========================== helpers =========================================
 
-    def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(DiscreteEventEngine,cls).__new__(cls, *args, **kwargs)
-        return cls._instance
-    #===== end singleton
+class _NoLock(object):
+    """Replaces dataLock when the engine runs in the calling thread."""
 
-    def __init__(self, cpuID=None, run_id=None, verbose=False):
+    def __enter__(self):
+        pass
 
-        #===== singleton
-        cls = type(self)
-        if cls._init:
-            return
-        cls._init = True
-        #===== singleton
-        
-        try:
-            # store params
-            self.cpuID                          = cpuID
-            self.run_id                         = run_id
-            self.verbose                        = verbose
-
-            # local variables
-            self.dataLock                       = threading.RLock()
-            self.pauseSem                       = threading.Semaphore(0)
-            self.simPaused                      = False
-            self.goOn                           = True
-            self.asn                            = 0
-            self.exc                            = None
-            self.events                         = []
-            self.random_seed                    = None
-            self._init_additional_local_variables()
-
-            # initialize parent class
-            threading.Thread.__init__(self)
-            self.name                           = 'DiscreteEventEngine'
-        except:
-            # an exception happened when initializing the instance
-            
-            # destroy the singleton
-            cls._instance         = None
-            cls._init             = False
-            raise
+    def __exit__(self, *args):
+        pass
+
+def _get_callback_type(cb):
+    """Name the type of a callback: its class and method names."""
+    owner = getattr(cb, 'im_self', None)
+    if owner is None:
+        return cb.__name__
+    return '{0}.{1}'.format(type(owner).__name__, cb.__name__)
+
+def _make_cell(value):
+    """Create a closure cell holding 'value'."""
+    return (lambda: value).func_closure[0]
+
+# =========================== body ============================================
+
+class DiscreteEventEngine(threading.Thread):
+
+    def __init__(self, cpuID=None, run_id=None, verbose=False, fast_forward=True, profile=False, progress_cb=None):
+
+        # store params
+        self.cpuID                          = cpuID
+        self.run_id                         = run_id
+        self.verbose                        = verbose
+        self.fast_forward                   = fast_forward
+        self.profile                        = profile
+        self.progress_cb                    = progress_cb
+
+        # local variables
+        self.dataLock                       = threading.RLock()
+        self.pauseSem                       = threading.Semaphore(0)
+        self.simPaused                      = False
+        self.isBlocking                     = False # running in the calling thread (run_until)
+        self.goOn                           = True
+        self.simEnded                       = False
+        self.asn                            = 0
+        self.intraSlotOrder                 = None # of the event being executed
+        self.numSlotsExecuted               = 0    # ASNs at which at least one event was executed
+        self.numEventsExecuted              = 0
+        self.asnEndExperiment               = None # ASN at which the simulation ends, if known
+        self.exc                            = None
+        self.events                         = [] # heap of [asn, intraSlotOrder, seq, cb, uniqueTag]
+        self.eventSeq                       = itertools.count() # insertion order among same (asn, intraSlotOrder)
+        self.eventsByTag                    = {}  # pending event, indexed by uniqueTag
+        self.numCancelledEvents             = 0   # cancelled events still in self.events
+        self.numEventsScheduled             = 0
+        self.numEventsRemoved               = 0   # cancelled by removeFutureEvent()
+        self.profileStats                   = {}  # per callback type, when profiling
+        self.lastProgress                   = None # (time, asn, numEventsExecuted) of the last progress report
+        self.random_seed                    = None
+        self.random                         = random.Random() # random numbers of this simulation
+        self._init_additional_local_variables()
+
+        # initialize parent class
+        threading.Thread.__init__(self)
+        self.name                           = 'DiscreteEventEngine'
 
     def destroy(self):
-        if self._Thread__initialized:
-            # initialization finished without exception
-            
-            if self.is_alive():
-                # thread is start'ed
-                self.play()           # cause one more loop in thread
-                self._actionEndSim()  # causes self.gOn to be set to False
-                self.join()           # wait until thread is dead
-            else:
-                # thread NOT start'ed yet, or crashed
-                
-                # destroy the singleton
-                cls = type(self)
-                cls._instance         = None
-                cls._init             = False
-        else:
-            # initialization failed
-            pass # do nothing, singleton already destroyed
+        if self._Thread__initialized and self.is_alive():
+            # thread is start'ed
+            self.play()           # cause one more loop in thread
+            self._actionEndSim()  # causes self.gOn to be set to False
+            self.join()           # wait until thread is dead
 
     #======================== thread ==========================================
 
@@ -99,75 +108,25 @@ class DiscreteEventEngine(threading.Thread):
             # additional routine
             self._routine_thread_started()
 
-            # consume events until self.goOn is False
-            while self.goOn:
+            # consume events until the simulation ends
+            while True:
 
                 with self.dataLock:
-                    
-                    # abort simulation when no more events
-                    if not self.events:
-                        break
-                    
-                    # make sure we are in the future
-                    (a, b, cb, c) = self.events[0]
-                    if c[1] != '_actionPauseSim':
-                        assert self.events[0][0] >= self.asn
-                    
-                    # update the current ASN
-                    self.asn = self.events[0][0]
-                    
-                    # find callbacks for this ASN
-                    cbs = []
-                    while True:
-                        if (not self.events) or (self.events[0][0] != self.asn):
-                            break
-                        (_, _, cb, _) = self.events.pop(0)
-                        cbs += [cb]
-                        
-                # call the callbacks (outside the dataLock)
-                
-                for cb in cbs:
+                    cb = self._pop_next_event()
+
+                if cb is None:
+                    break
+
+                # call the callback (outside the dataLock); it may schedule
+                # events later in the current ASN
+                if self.profile:
+                    self._call_profiled(cb)
+                else:
                     cb()
 
         except Exception as e:
             # thread crashed
-            
-            # record the exception
-            self.exc = e
-            
-            # additional routine
-            self._routine_thread_crashed()
-            
-            # print
-            output  = []
-            output += ['']
-            output += ['==============================']
-            output += ['']
-            output += ['CRASH in {0}!'.format(self.name)]
-            output += ['']
-            output += [traceback.format_exc()]
-            output += ['==============================']
-            output += ['']
-            output += ['The following settings are used:']
-            output += ['']
-            for k, v in SimSettings.SimSettings().__dict__.iteritems():
-                if (
-                        (k == 'exec_randomSeed')
-                        and
-                        (v in ['random', 'context'])
-                    ):
-                    # put the random seed value in output
-                    # exec_randomSeed: random
-                    v = '{0} ({1})'.format(v, self.random_seed)
-                output += ['{0}: {1}'.format(str(k), str(v))]
-            output += ['']
-            output += ['==============================']
-            output += ['']
-            output  = '\n'.join(output)
-            sys.stderr.write(output)
-
-            # flush all the buffered log data
-            SimLog.SimLog().flush()
+            self._handle_crash(e)
 
         else:
             # thread ended (gracefully)
@@ -177,19 +136,78 @@ class DiscreteEventEngine(threading.Thread):
             
             # additional routine
             self._routine_thread_ended()
-            
-        finally:
-            
-            # destroy this singleton
-            cls = type(self)
-            cls._instance                      = None
-            cls._init                          = False
 
     def join(self):
         super(DiscreteEventEngine, self).join()
         if self.exc:
             raise self.exc
 
+    #======================== blocking ========================================
+
+    def run_blocking(self):
+        """ run the simulation until its end, in the calling thread """
+        self.run_until(None)
+
+    def run_until(self, asn):
+        """
+        Run the simulation in the calling thread, until all the events up to
+        'asn' are executed or the simulation ends. 'asn' set to None runs the
+        simulation until its end. Call again to resume the simulation.
+
+        The engine is not started as a thread, and the dataLock is not used.
+        Use this instead of start() and pauseAtAsn().
+
+        Returns True when the simulation has ended.
+        """
+
+        if self.simEnded:
+            # nothing left to run, the end is already logged
+            return True
+
+        assert not self.is_alive()
+        assert (asn is None) or (asn >= self.asn)
+
+        if not self.isBlocking:
+            # first call; no other thread touches the engine
+            self.isBlocking = True
+            self.dataLock   = _NoLock()
+
+            # additional routine
+            self._routine_thread_started()
+
+        try:
+            # consume events
+            while True:
+                cb = self._pop_next_event(until_asn=asn)
+                if cb is None:
+                    break
+                if self.profile:
+                    self._call_profiled(cb)
+                else:
+                    cb()
+
+        except Exception as e:
+            # simulation crashed
+            self._handle_crash(e)
+            raise
+
+        if self.events and self.goOn:
+            # the simulation is paused at the end of 'asn'
+            self.asn            = asn
+            self.intraSlotOrder = None
+            return False
+
+        # simulation ended (gracefully)
+        self.simEnded = True
+
+        # no exception
+        self.exc = None
+
+        # additional routine
+        self._routine_thread_ended()
+
+        return True
+
     #======================== public ==========================================
     
     # === getters/setters
@@ -199,6 +217,37 @@ class DiscreteEventEngine(threading.Thread):
 
     def get_mote_by_id(self, mote_id):
         return self.motes[mote_id]
+
+    def get_slot_stats(self):
+        """
+        Return the number of slots in which events were executed, and the
+        number of slots the engine jumped over since the beginning of the run.
+        """
+        return {
+            'executed': self.numSlotsExecuted,
+            'skipped':  self.asn - self.numSlotsExecuted,
+        }
+
+    def get_profile(self):
+        """
+        Return, per callback type, the number of calls, their total and
+        maximum wall-clock durations in seconds, and the number of events they
+        scheduled and cancelled. Only filled in when profiling.
+        """
+        return dict(
+            (
+                callback_type,
+                {
+                    'calls':     calls,
+                    'total':     total,
+                    'max':       max_duration,
+                    'scheduled': scheduled,
+                    'cancelled': cancelled,
+                }
+            )
+            for (callback_type, [calls, total, max_duration, scheduled, cancelled])
+            in self.profileStats.iteritems()
+        )
     
     #=== scheduling
     
@@ -206,23 +255,35 @@ class DiscreteEventEngine(threading.Thread):
         """
         Schedule an event at a particular ASN in the future.
         Also removed all future events with the same uniqueTag.
+
+        An event can also be scheduled at the current ASN, with an
+        intraSlotOrder after the one of the event being executed.
         """
 
         # make sure we are scheduling in the future
-        assert asn > self.asn
+        assert (
+            (asn > self.asn)
+            or
+            (
+                (asn == self.asn)
+                and
+                (self.intraSlotOrder is not None)
+                and
+                (intraSlotOrder > self.intraSlotOrder)
+            )
+        )
 
         # remove all events with same uniqueTag (the event will be rescheduled)
         self.removeFutureEvent(uniqueTag)
 
         with self.dataLock:
 
-            # find correct index in schedule
-            i = 0
-            while i<len(self.events) and (self.events[i][0] < asn or (self.events[i][0] == asn and self.events[i][1] <= intraSlotOrder)):
-                i +=1
-
-            # add to schedule
-            self.events.insert(i, (asn, intraSlotOrder, cb, uniqueTag))
+            # add to schedule; the sequence number keeps events with the same
+            # (asn, intraSlotOrder) in the order they were scheduled
+            event = [asn, intraSlotOrder, next(self.eventSeq), cb, uniqueTag]
+            heapq.heappush(self.events, event)
+            self.eventsByTag[uniqueTag] = event
+            self.numEventsScheduled    += 1
     
     def scheduleIn(self, delay, cb, uniqueTag, intraSlotOrder):
         """
@@ -251,13 +312,30 @@ class DiscreteEventEngine(threading.Thread):
     # === misc
 
     def removeFutureEvent(self, uniqueTag):
+        """
+        Cancel the pending event having uniqueTag, unless it is scheduled at
+        the current ASN.
+
+        The event is only marked as cancelled; it is dropped from the queue
+        when it reaches the head, or when cancelled events make up more than
+        half of the queue.
+        """
         with self.dataLock:
-            i = 0
-            while i<len(self.events):
-                if (self.events[i][3]==uniqueTag) and (self.events[i][0]!=self.asn):
-                    self.events.pop(i)
-                else:
-                    i += 1
+            event = self.eventsByTag.get(uniqueTag)
+            if (event is None) or (event[0]==self.asn):
+                return
+
+            # cancel
+            del self.eventsByTag[uniqueTag]
+            event[3]                 = None
+            self.numCancelledEvents += 1
+            self.numEventsRemoved   += 1
+
+            # compact the queue
+            if self.numCancelledEvents > len(self.events) / 2:
+                self.events = [e for e in self.events if e[3] is not None]
+                heapq.heapify(self.events)
+                self.numCancelledEvents = 0
 
     def terminateSimulation(self,delay):
         with self.dataLock:
@@ -271,7 +349,97 @@ class DiscreteEventEngine(threading.Thread):
 
     # ======================== private ========================================
 
+    def _pop_next_event(self, until_asn=None):
+        """
+        Pop the next event to execute, and return its callback. Return None
+        when the simulation is over, or when the next event is after
+        'until_asn'. The events of the current ASN are always all executed.
+        """
+
+        # discard cancelled events
+        self._discard_cancelled_events()
+
+        # abort simulation when no more events
+        if not self.events:
+            return None
+
+        # abort simulation at the end of the ASN, if asked to
+        if (not self.goOn) and (self.events[0][0] != self.asn):
+            return None
+
+        # stop before going past until_asn
+        if (until_asn is not None) and (self.events[0][0] > until_asn):
+            return None
+
+        # make sure we are in the future
+        (a, b, _, cb, c) = self.events[0]
+        if c[1] != '_actionPauseSim':
+            assert self.events[0][0] >= self.asn
+
+        # pop the next event, update the current ASN
+        event = heapq.heappop(self.events)
+        if self.eventsByTag.get(c) is event:
+            del self.eventsByTag[c]
+        if a != self.asn:
+            self.numSlotsExecuted += 1
+        self.numEventsExecuted += 1
+        self.asn            = a
+        self.intraSlotOrder = b
+
+        return cb
+
+    def _handle_crash(self, e):
+
+        # record the exception
+        self.exc = e
+
+        # print
+        output  = []
+        output += ['']
+        output += ['==============================']
+        output += ['']
+        output += ['CRASH in {0}!'.format(self.name)]
+        output += ['']
+        output += [traceback.format_exc()]
+        output += ['==============================']
+        output += ['']
+        output  = '\n'.join(output)
+        sys.stderr.write(output)
+
+        # additional routine
+        self._routine_thread_crashed()
+
+    def _call_profiled(self, cb):
+        """
+        Call the callback, and account its duration and the events it
+        scheduled and cancelled to its callback type.
+        """
+
+        numEventsScheduled = self.numEventsScheduled
+        numEventsRemoved   = self.numEventsRemoved
+
+        start              = time.time()
+        cb()
+        duration           = time.time() - start
+
+        callback_type      = _get_callback_type(cb)
+        stats              = self.profileStats.get(callback_type)
+        if stats is None:
+            stats          = [0, 0.0, 0.0, 0, 0]
+            self.profileStats[callback_type] = stats
+        stats[0]          += 1
+        stats[1]          += duration
+        stats[2]           = max(stats[2], duration)
+        stats[3]          += self.numEventsScheduled - numEventsScheduled
+        stats[4]          += self.numEventsRemoved   - numEventsRemoved
+
+    def _discard_cancelled_events(self):
+        while self.events and (self.events[0][3] is None):
+            heapq.heappop(self.events)
+            self.numCancelledEvents -= 1
+
     def _actionPauseSim(self):
+        assert not self.isBlocking # use run_until() instead
         assert self.simPaused==False
         self.simPaused = True
         self.pauseSem.acquire()
@@ -294,6 +462,10 @@ class DiscreteEventEngine(threading.Thread):
         if self.verbose:
             print('   slotframe_iteration: {0}/{1}'.format(slotframe_iteration, self.settings.exec_numSlotframesPerRun-1))
 
+        # report progress
+        if self.progress_cb:
+            self._report_progress()
+
         # schedule next statistics collection
         self.scheduleAtAsn(
             asn              = self.asn + self.settings.tsch_slotframeLength,
@@ -301,6 +473,40 @@ class DiscreteEventEngine(threading.Thread):
             uniqueTag        = ('DiscreteEventEngine', '_actionEndSlotframe'),
             intraSlotOrder   = Mote.MoteDefines.INTRASLOTORDER_ADMINTASKS,
         )
+
+    def _report_progress(self):
+        """
+        Call progress_cb with the throughput since the previous report, at
+        most every PROGRESS_PERIOD seconds.
+        """
+
+        now = time.time()
+        if self.lastProgress is None:
+            # first call, nothing to measure yet
+            self.lastProgress = (now, self.asn, self.numEventsExecuted)
+            return
+        (lastTime, lastAsn, lastNumEventsExecuted) = self.lastProgress
+        if now - lastTime <= PROGRESS_PERIOD:
+            return
+        self.lastProgress = (now, self.asn, self.numEventsExecuted)
+
+        slotsPerSecond  = (self.asn - lastAsn) / (now - lastTime)
+        eventsPerSecond = (self.numEventsExecuted - lastNumEventsExecuted) / (now - lastTime)
+        if (self.asnEndExperiment is None) or (slotsPerSecond == 0):
+            eta = None
+        else:
+            eta = (self.asnEndExperiment - self.asn) / slotsPerSecond
+
+        self.progress_cb(
+            {
+                'asn':             self.asn,
+                'asnEnd':          self.asnEndExperiment,
+                'slotsPerSecond':  slotsPerSecond,
+                'eventsPerSecond': eventsPerSecond,
+                'queueDepth':      len(self.events) - self.numCancelledEvents,
+                'eta':             eta,
+            }
+        )
     
     # ======================== abstract =======================================
     
@@ -320,9 +526,142 @@ class DiscreteEventEngine(threading.Thread):
 class SimEngine(DiscreteEventEngine):
     
     DAGROOT_ID = 0
+
+    # engine attributes saved by snapshot()
+    SNAPSHOT_ATTRIBUTES = [
+        'asn',
+        'numSlotsExecuted',
+        'numEventsExecuted',
+        'asnEndExperiment',
+        'goOn',
+        'simEnded',
+        'events',
+        'eventSeq',
+        'eventsByTag',
+        'numCancelledEvents',
+        'random_seed',
+        'moduleRandomState',
+        'dataPktsCrossing',
+        'motes',
+        'connectivity',
+    ]
+
+    # ==== start current instance
+    # SimEngine() without parameters returns the engine created last, for code
+    # which is not handed the engine of its simulation
+    _instance      = None
+
+    def __new__(cls, *args, **kwargs):
+        if (not args) and (not kwargs) and cls._instance:
+            return cls._instance
+        return super(SimEngine, cls).__new__(cls)
+    # ==== end current instance
+
+    def __init__(self, settings=None, simlog=None, **kwargs):
+
+        # ==== start current instance
+        cls = type(self)
+        if self is cls._instance:
+            return
+        cls._instance = self
+        # ==== end current instance
+
+        # store params
+        self.settings                   = settings
+        self.simlog                     = simlog
+
+        # initialize parent class
+        try:
+            super(SimEngine, self).__init__(**kwargs)
+        except:
+            # an exception happened when initializing the instance
+            cls._instance = None
+            raise
+
+    def destroy(self):
+        super(SimEngine, self).destroy()
+
+        cls = type(self)
+        if cls._instance is self:
+            cls._instance = None
+
+    #======================== run =============================================
+
+    def run(self):
+        with self._module_random_state():
+            super(SimEngine, self).run()
+
+    def run_until(self, asn):
+        with self._module_random_state():
+            return super(SimEngine, self).run_until(asn)
+
+    #======================== snapshot ========================================
+
+    def snapshot(self, path):
+        """
+        Save the complete state of the simulation to the file 'path'.
+
+        Take the snapshot between two run_until() calls. The settings and the
+        log are not saved, the engine they belong to is restored with them.
+        """
+
+        assert not self.is_alive()
+        assert self.intraSlotOrder is None # not in the middle of a slot
+
+        # all the logs so far are part of the snapshot
+        self.simlog.flush()
+
+        state = dict([(name, getattr(self, name)) for name in self.SNAPSHOT_ATTRIBUTES])
+        state['isStarted']              = self.isBlocking
+        state['random_state']           = self.random.getstate()
+        state['log_file']               = os.path.abspath(self.simlog.log_output_file.name)
+        state['log_offset']             = self.simlog.log_output_file.tell()
+
+        # state kept outside of the motes
+        state['settings_count']         = self.settings.count
+
+        with open(path, 'wb') as f:
+            pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+            pickler.persistent_id = self._snapshot_persistent_id
+            pickler.dump(state)
+
+    def restore(self, path):
+        """
+        Replace the state of the simulation by the one saved in the file
+        'path' by snapshot(). Continue the simulation with run_until() or
+        run_blocking(); it runs exactly as the simulation the snapshot was
+        taken from.
+
+        When the log file is the one of the snapshot, it is truncated to where
+        it was when the snapshot was taken.
+        """
+
+        assert not self.is_alive()
+
+        with open(path, 'rb') as f:
+            unpickler = cPickle.Unpickler(f)
+            unpickler.persistent_load = self._snapshot_persistent_load
+            state = unpickler.load()
+
+        for name in self.SNAPSHOT_ATTRIBUTES:
+            setattr(self, name, state[name])
+        self.intraSlotOrder = None
+        if state['isStarted']:
+            # the snapshot was taken between two run_until() calls
+            self.isBlocking = True
+            self.dataLock   = _NoLock()
+        self.random.setstate(state['random_state'])
+
+        # state kept outside of the motes
+        self.settings.count = state['settings_count']
+
+        # drop the logs written after the snapshot
+        self.simlog.flush()
+        if os.path.abspath(self.simlog.log_output_file.name) == state['log_file']:
+            self.simlog.log_output_file.truncate(state['log_offset'])
+            self.simlog.log_output_file.seek(0, os.SEEK_END)
     
     def _init_additional_local_variables(self):
-        self.settings                   = SimSettings.SimSettings()
 
         # set random seed
         if   self.settings.exec_randomSeed == 'random':
@@ -341,12 +680,23 @@ class SimEngine(DiscreteEventEngine):
             assert isinstance(self.settings.exec_randomSeed, int)
             self.random_seed = self.settings.exec_randomSeed
         # apply the random seed; log the seed after self.log is initialized
-        random.seed(a=self.random_seed)
+        self.random.seed(a=self.random_seed)
+
+        # the trickle timer of RPL, which is not part of the simulator, draws
+        # from the random module; it gets a state of its own per simulation,
+        # swapped in while the simulation runs
+        self.moduleRandomState          = random.Random(self.random.getrandbits(64)).getstate()
 
-        self.motes                      = [Mote.Mote.Mote(m) for m in range(self.settings.exec_numMotes)]
-        self.connectivity               = Connectivity.Connectivity()
-        self.log                        = SimLog.SimLog().log
-        SimLog.SimLog().set_simengine(self)
+        # DATA packets sent to each neighbor without a dedicated cell, indexed
+        # by str((mote_id, neighbor_id)); see Sixlowpan
+        self.dataPktsCrossing           = {}
+
+        # the engine is the context of the simulation; the motes and the
+        # connectivity get the settings and the log through it
+        self.log                        = self.simlog.log
+        self.simlog.set_simengine(self)
+        self.motes                      = [Mote.Mote.Mote(m, self) for m in range(self.settings.exec_numMotes)]
+        self.connectivity               = Connectivity.Connectivity(self)
 
         # log the random seed
         self.log(
@@ -360,9 +710,20 @@ class SimEngine(DiscreteEventEngine):
         self.motes[self.DAGROOT_ID].setDagRoot()
 
         # boot all motes
-        for i in range(len(self.motes)):
-            self.motes[i].boot()
+        with self._module_random_state():
+            for i in range(len(self.motes)):
+                self.motes[i].boot()
     
+    @contextlib.contextmanager
+    def _module_random_state(self):
+        # give the random module the state of this simulation, and keep what
+        # is drawn from it
+        random.setstate(self.moduleRandomState)
+        try:
+            yield
+        finally:
+            self.moduleRandomState = random.getstate()
+
     def _routine_thread_started(self):
         # log
         self.log(
@@ -374,8 +735,9 @@ class SimEngine(DiscreteEventEngine):
         )
         
         # schedule end of simulation
+        self.asnEndExperiment = self.settings.tsch_slotframeLength*self.settings.exec_numSlotframesPerRun
         self.scheduleAtAsn(
-            asn              = self.settings.tsch_slotframeLength*self.settings.exec_numSlotframesPerRun,
+            asn              = self.asnEndExperiment,
             cb               = self._actionEndSim,
             uniqueTag        = ('SimEngine','_actionEndSim'),
             intraSlotOrder   = Mote.MoteDefines.INTRASLOTORDER_ADMINTASKS,
@@ -389,6 +751,10 @@ class SimEngine(DiscreteEventEngine):
             intraSlotOrder   = Mote.MoteDefines.INTRASLOTORDER_ADMINTASKS,
         )
 
+        # visit every slot, if asked to
+        if not self.fast_forward:
+            self._schedule_tick()
+
     def _routine_thread_crashed(self):
         # log
         self.log(
@@ -399,6 +765,29 @@ class SimEngine(DiscreteEventEngine):
             }
         )
 
+        # print
+        output  = []
+        output += ['The following settings are used:']
+        output += ['']
+        for k, v in self.settings.__dict__.iteritems():
+            if (
+                    (k == 'exec_randomSeed')
+                    and
+                    (v in ['random', 'context'])
+                ):
+                # put the random seed value in output
+                # exec_randomSeed: random
+                v = '{0} ({1})'.format(v, self.random_seed)
+            output += ['{0}: {1}'.format(str(k), str(v))]
+        output += ['']
+        output += ['==============================']
+        output += ['']
+        output  = '\n'.join(output)
+        sys.stderr.write(output)
+
+        # flush all the buffered log data
+        self.simlog.flush()
+
     def _routine_thread_ended(self):
         # log
         self.log(
@@ -408,3 +797,119 @@ class SimEngine(DiscreteEventEngine):
                 "state": "stopped"
             }
         )
+
+        # print
+        if self.verbose:
+            slot_stats = self.get_slot_stats()
+            print('   slots executed: {0}, skipped: {1}'.format(
+                slot_stats['executed'],
+                slot_stats['skipped'],
+            ))
+
+        # write the profile next to the log file
+        if self.profile:
+            self._write_profile()
+
+    def _write_profile(self):
+        """Append the profile of the run to the profile file, as a table."""
+
+        profile = self.get_profile()
+        total   = sum([stats['total'] for stats in profile.values()])
+
+        output  = []
+        output += ['run_id {0}: {1} events, {2:.3f}s'.format(
+            self.run_id,
+            sum([stats['calls'] for stats in profile.values()]),
+            total,
+        )]
+        output += ['{0:<50} {1:>10} {2:>10} {3:>7} {4:>10} {5:>10} {6:>10}'.format(
+            'callback', 'calls', 'total (s)', '%', 'max (ms)', 'scheduled', 'cancelled'
+        )]
+        for (callback_type, stats) in sorted(profile.items(), key=lambda i: -i[1]['total']):
+            output += ['{0:<50} {1:>10} {2:>10.3f} {3:>7.1f} {4:>10.3f} {5:>10} {6:>10}'.format(
+                callback_type,
+                stats['calls'],
+                stats['total'],
+                100 * stats['total'] / total if total else 0,
+                1000 * stats['max'],
+                stats['scheduled'],
+                stats['cancelled'],
+            )]
+        output += ['']
+        output  = '\n'.join(output)
+
+        with open(self.settings.getProfileFile(), 'a') as f:
+            f.write(output + '\n')
+
+    def _schedule_tick(self):
+        self.scheduleAtAsn(
+            asn              = self.asn + 1,
+            cb               = self._actionTick,
+            uniqueTag        = ('SimEngine', '_actionTick'),
+            intraSlotOrder   = Mote.MoteDefines.INTRASLOTORDER_STARTSLOT,
+        )
+
+    def _actionTick(self):
+        """
+        Called at every slot when fast_forward is disabled; propagates the
+        slot whether a radio is on or not.
+        """
+        self.connectivity.schedule_propagate()
+        self._schedule_tick()
+
+    def _snapshot_persistent_id(self, obj):
+        """
+        Identify the objects snapshot() does not pickle as they are: the
+        context of the simulation, and the callbacks and locks pickle cannot
+        handle.
+        """
+        if obj is self:
+            return 'engine'
+        elif obj is self.settings:
+            return 'settings'
+        elif obj is self.simlog:
+            return 'simlog'
+        elif isinstance(obj, types.MethodType):
+            # bound method, re-bound when restored
+            return ('method', obj.im_self, obj.im_func.__name__)
+        elif (
+                isinstance(obj, types.FunctionType)
+                and
+                (getattr(sys.modules.get(obj.__module__), obj.__name__, None) is not obj)
+            ):
+            # lambda or closure, rebuilt from its code when restored
+            return (
+                'function',
+                marshal.dumps(obj.func_code),
+                obj.__module__,
+                obj.func_defaults,
+                tuple([cell.cell_contents for cell in obj.func_closure or []]),
+            )
+        elif isinstance(obj, threading._RLock):
+            return ('rlock',)
+        else:
+            return None
+
+    def _snapshot_persistent_load(self, pid):
+        if   pid == 'engine':
+            return self
+        elif pid == 'settings':
+            return self.settings
+        elif pid == 'simlog':
+            return self.simlog
+        elif pid[0] == 'method':
+            (_, obj, name) = pid
+            return getattr(obj, name)
+        elif pid[0] == 'function':
+            (_, code, module, defaults, closure) = pid
+            return types.FunctionType(
+                marshal.loads(code),
+                sys.modules[module].__dict__,
+                None,
+                defaults,
+                tuple([_make_cell(value) for value in closure]) or None,
+            )
+        elif pid[0] == 'rlock':
+            return threading.RLock()
+        else:
+            raise cPickle.UnpicklingError('unknown persistent id {0}'.format(pid))
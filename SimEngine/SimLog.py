@@ -17,7 +17,6 @@ import copy
 import json
 import traceback
 
-import SimSettings
 import SimEngine
 
 # =========================== defines =========================================
@@ -100,48 +99,36 @@ LOG_PROP_DROP_LOCKON              = {'type': 'prop.drop_lockon' ,         'keys'
 
 class SimLog(object):
 
-    # ==== start singleton
+    # ==== start current instance
+    # SimLog() without parameters returns the log created last, for code which
+    # is not handed the log of its simulation
     _instance      = None
-    _init          = False
 
     def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(SimLog, cls).__new__(cls, *args, **kwargs)
-        return cls._instance
-    # ==== end singleton
+        if (not args) and (not kwargs) and cls._instance:
+            return cls._instance
+        return super(SimLog, cls).__new__(cls)
+    # ==== end current instance
 
-    def __init__(self, failIfNotInit=False):
+    def __init__(self, settings=None):
 
-        if failIfNotInit and not self._init:
-            raise EnvironmentError('SimLog singleton not initialized.')
-
-        # ==== start singleton
+        # ==== start current instance
         cls = type(self)
-        if cls._init:
+        if self is cls._instance:
             return
-        cls._init = True
-        # ==== end singleton
+        cls._instance = self
+        # ==== end current instance
 
-        # get singletons
-        self.settings   = SimSettings.SimSettings()
+        # store params
+        self.settings   = settings
         self.engine     = None # will be defined by set_simengine
 
         # local variables
         self.log_filters = []
 
-        # open log file
+        # open log file, write config line
         self.log_output_file = open(self.settings.getOutputFile(), 'a')
-
-        # write config to log file; if a file with the same file name exists,
-        # append logs to the file. this happens if you multiple runs on the
-        # same CPU. And amend config line; config line in log file should have
-        # '_type' field. And 'run_id' type should be '_run_id'
-        config_line = copy.deepcopy(self.settings.__dict__)
-        config_line['_type']   = 'config'
-        config_line['_run_id'] = config_line['run_id']
-        del config_line['run_id']
-        json_string = json.dumps(config_line)
-        self.log_output_file.write(json_string + '\n')
+        self._write_config_line()
 
     def log(self, simlog, content):
         """
@@ -197,6 +184,26 @@ class SimLog(object):
         assert not self.log_output_file.closed
         self.log_output_file.flush()
 
+    def switch_output_file(self):
+        """
+        Move the log to the output file of the current settings.
+
+        The logs written so far are copied to the new file, after a config line
+        reflecting the current settings. The old file is left as it is.
+        """
+
+        # read the logs written after the config line
+        self.flush()
+        with open(self.log_output_file.name, 'r') as f:
+            f.seek(self.log_start_offset)
+            logs = f.read()
+        self.log_output_file.close()
+
+        # write them to the new file
+        self.log_output_file = open(self.settings.getOutputFile(), 'a')
+        self._write_config_line()
+        self.log_output_file.write(logs)
+
     def set_simengine(self, engine):
         self.engine = engine
 
@@ -209,7 +216,22 @@ class SimLog(object):
             self.log_output_file.close()
 
         cls = type(self)
-        cls._instance       = None
-        cls._init           = False
+        if cls._instance is self:
+            cls._instance = None
 
     # ============================== private ==================================
+
+    def _write_config_line(self):
+        # write config to log file; if a file with the same file name exists,
+        # append logs to the file. this happens if you multiple runs on the
+        # same CPU. And amend config line; config line in log file should have
+        # '_type' field. And 'run_id' type should be '_run_id'
+        config_line = copy.deepcopy(self.settings.__dict__)
+        config_line['_type']   = 'config'
+        config_line['_run_id'] = config_line['run_id']
+        del config_line['run_id']
+        json_string = json.dumps(config_line)
+        self.log_output_file.write(json_string + '\n')
+
+        # the logs of this simulation start here
+        self.log_start_offset = self.log_output_file.tell()
@@ -22,27 +22,25 @@ class SimSettings(object):
     # ==== class attributes / definitions
     LOG_ROOT_DIR   = 'simData'
 
-    # ==== start singleton
+    # ==== start current instance
+    # SimSettings() without parameters returns the settings created last, for
+    # code which is not handed the settings of its simulation
     _instance      = None
-    _init          = False
 
     def __new__(cls, *args, **kwargs):
-        if not cls._instance:
-            cls._instance = super(SimSettings, cls).__new__(cls, *args, **kwargs)
-        return cls._instance
-    # ==== end singleton
+        if (not args) and (not kwargs) and cls._instance:
+            return cls._instance
+        return super(SimSettings, cls).__new__(cls)
+    # ==== end current instance
 
-    def __init__(self, cpuID=None, run_id=None, failIfNotInit=False, **kwargs):
+    def __init__(self, cpuID=None, run_id=None, **kwargs):
 
-        if failIfNotInit and not self._init:
-            raise EnvironmentError('SimSettings singleton not initialized.')
-
-        # ==== start singleton
+        # ==== start current instance
         cls = type(self)
-        if cls._init:
+        if self is cls._instance:
             return
-        cls._init = True
-        # ==== end singleton
+        cls._instance = self
+        # ==== end current instance
 
         # store params
         self.cpuID                          = cpuID
@@ -66,6 +64,33 @@ class SimSettings(object):
         self.combinationKeys = combinationKeys
 
     def getOutputFile(self):
+        # file
+        if self.cpuID is None:
+            tempname         = 'output.dat'
+        else:
+            tempname         = 'output_cpu{0}.dat'.format(self.cpuID)
+        datafilename         = os.path.join(self._getOutputDirectory(), tempname)
+
+        return datafilename
+
+    def getProfileFile(self):
+        # file, next to the output file
+        if self.cpuID is None:
+            tempname         = 'profile.txt'
+        else:
+            tempname         = 'profile_cpu{0}.txt'.format(self.cpuID)
+        profilefilename      = os.path.join(self._getOutputDirectory(), tempname)
+
+        return profilefilename
+
+    def destroy(self):
+        cls = type(self)
+        if cls._instance is self:
+            cls._instance = None
+
+    # ======================== private ========================================
+
+    def _getOutputDirectory(self):
         # directory
         dirname   = os.path.join(
             self.LOG_ROOT_DIR,
@@ -89,16 +114,4 @@ class SimSettings(object):
                 else:
                     raise
 
-        # file
-        if self.cpuID is None:
-            tempname         = 'output.dat'
-        else:
-            tempname         = 'output_cpu{0}.dat'.format(self.cpuID)
-        datafilename         = os.path.join(dirname, tempname)
-
-        return datafilename
-
-    def destroy(self):
-        cls = type(self)
-        cls._instance       = None
-        cls._init           = False
+        return dirname
@@ -0,0 +1,238 @@
+#!/usr/bin/python
+"""
+\brief Benchmarks of the discrete-event engine.
+
+- 'scheduling' measures the cost of scheduling (and rescheduling) an event as
+  a function of the number of pending events in the engine's queue.
+- 'longRun' runs a long, low-traffic simulation twice, with and without
+  fast-forwarding over idle slots, and compares the wall-clock times.
+- 'runModes' measures the cost of executing an event when the engine runs as
+  a thread (start/join), and when it runs in the calling thread
+  (run_blocking).
+"""
+
+# =========================== adjust path =====================================
+
+import os
+import sys
+
+if __name__ == '__main__':
+    here = sys.path[0]
+    sys.path.insert(0, os.path.join(here, '..'))
+
+# =========================== imports =========================================
+
+import argparse
+import json
+import random
+import time
+
+from SimEngine import SimConfig,   \
+                      SimEngine,   \
+                      SimLog,      \
+                      SimSettings
+
+# =========================== defines =========================================
+
+BENCHMARKS          = ['scheduling', 'longRun', 'runModes']
+
+DEFAULT_QUEUE_SIZES = [100, 1000, 10000, 100000]
+DEFAULT_NUM_OPS     = 10000
+DEFAULT_NUM_EVENTS  = 1000000
+
+LONG_RUN_SETTINGS   = {
+    'exec_numMotes':            10,
+    'exec_numSlotframesPerRun': 10000,
+    'app_pkPeriod':             300,
+}
+
+# =========================== helpers =========================================
+
+def parseCliParams():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--benchmarks',
+        dest       = 'benchmarks',
+        nargs      = '+',
+        choices    = BENCHMARKS,
+        default    = BENCHMARKS,
+        help       = 'Benchmarks to run.',
+    )
+    parser.add_argument(
+        '--config',
+        dest       = 'config',
+        action     = 'store',
+        default    = 'config.json',
+        help       = 'Configuration file the long run is based on.',
+    )
+    parser.add_argument(
+        '--queueSizes',
+        dest       = 'queueSizes',
+        nargs      = '+',
+        type       = int,
+        default    = DEFAULT_QUEUE_SIZES,
+        help       = 'Numbers of pending events to benchmark against.',
+    )
+    parser.add_argument(
+        '--numOps',
+        dest       = 'numOps',
+        type       = int,
+        default    = DEFAULT_NUM_OPS,
+        help       = 'Number of scheduling operations per measurement.',
+    )
+    parser.add_argument(
+        '--numEvents',
+        dest       = 'numEvents',
+        type       = int,
+        default    = DEFAULT_NUM_EVENTS,
+        help       = 'Number of events executed per run mode.',
+    )
+    cliparams      = parser.parse_args()
+    return cliparams.__dict__
+
+def _noop():
+    pass
+
+def benchmark_scheduling(queueSize, numOps):
+    """
+    Fill the engine with 'queueSize' pending events, then measure the time of
+    'numOps' scheduleAtAsn() calls, each of which reschedules one of the
+    pending events. Returns the average cost of one call, in microseconds.
+    """
+
+    engine = SimEngine.DiscreteEventEngine()
+    try:
+        # fill the queue
+        for i in range(queueSize):
+            engine.scheduleAtAsn(
+                asn              = random.randint(1, queueSize),
+                cb               = _noop,
+                uniqueTag        = (i, 'benchmark'),
+                intraSlotOrder   = random.randint(0, 3),
+            )
+
+        # measure
+        tags     = [(random.randint(0, queueSize-1), 'benchmark') for _ in range(numOps)]
+        start    = time.time()
+        for tag in tags:
+            engine.scheduleAtAsn(
+                asn              = random.randint(1, queueSize),
+                cb               = _noop,
+                uniqueTag        = tag,
+                intraSlotOrder   = random.randint(0, 3),
+            )
+        duration = time.time() - start
+    finally:
+        engine.destroy()
+
+    return 1000000 * duration / numOps
+
+def benchmark_long_run(simconfig, fast_forward):
+    """
+    Run a single simulation with the LONG_RUN_SETTINGS. Returns the wall-clock
+    duration of the run, in seconds, and the slot statistics of the engine.
+    """
+
+    simParam = dict(simconfig.settings.regular)
+    simParam.update(LONG_RUN_SETTINGS)
+
+    # create the simulation; nothing gets logged
+    settings   = SimSettings.SimSettings(cpuID=0, run_id=0, **simParam)
+    settings.setLogDirectory('benchmark')
+    settings.setCombinationKeys([])
+    simlog     = SimLog.SimLog(settings)
+    simlog.set_log_filters([])
+    simengine  = SimEngine.SimEngine(settings, simlog, run_id=0, fast_forward=fast_forward)
+
+    # run
+    start      = time.time()
+    simengine.run_blocking()
+    duration   = time.time() - start
+    slot_stats = simengine.get_slot_stats()
+
+    # destroy the simulation, remove the log file
+    output_file = settings.getOutputFile()
+    simlog.destroy()
+    simengine.destroy()
+    settings.destroy()
+    os.remove(output_file)
+
+    return duration, slot_stats
+
+def benchmark_run_mode(numEvents, blocking):
+    """
+    Execute 'numEvents' events, one per slot, each scheduling the next one.
+    Returns the average cost of one event, in microseconds.
+    """
+
+    engine = SimEngine.DiscreteEventEngine()
+
+    def _reschedule():
+        if engine.getAsn() < numEvents:
+            engine.scheduleAtAsn(
+                asn              = engine.getAsn() + 1,
+                cb               = _reschedule,
+                uniqueTag        = (None, 'benchmark'),
+                intraSlotOrder   = 0,
+            )
+
+    engine.scheduleAtAsn(
+        asn              = 1,
+        cb               = _reschedule,
+        uniqueTag        = (None, 'benchmark'),
+        intraSlotOrder   = 0,
+    )
+
+    # measure
+    start    = time.time()
+    if blocking:
+        engine.run_blocking()
+    else:
+        engine.start()
+        engine.join()
+    duration = time.time() - start
+
+    engine.destroy()
+
+    return 1000000 * duration / numEvents
+
+# =========================== main ============================================
+
+def main():
+
+    cliparams = parseCliParams()
+
+    if 'scheduling' in cliparams['benchmarks']:
+        random.seed(0)
+
+        print '{0:>15} {1:>20}'.format('pending events', 'scheduleAtAsn (us)')
+        for queueSize in cliparams['queueSizes']:
+            cost = benchmark_scheduling(queueSize, cliparams['numOps'])
+            print '{0:>15} {1:>20.2f}'.format(queueSize, cost)
+
+    if 'longRun' in cliparams['benchmarks']:
+        simconfig = SimConfig.SimConfig(configfile=cliparams['config'])
+
+        print 'long run: {0}'.format(json.dumps(LONG_RUN_SETTINGS, sort_keys=True))
+        print '{0:>15} {1:>12} {2:>15} {3:>15}'.format(
+            'fast_forward', 'duration (s)', 'slots executed', 'slots skipped'
+        )
+        for fast_forward in [False, True]:
+            (duration, slot_stats) = benchmark_long_run(simconfig, fast_forward)
+            print '{0:>15} {1:>12.1f} {2:>15} {3:>15}'.format(
+                str(fast_forward),
+                duration,
+                slot_stats['executed'],
+                slot_stats['skipped'],
+            )
+
+    if 'runModes' in cliparams['benchmarks']:
+        print '{0:>15} {1:>15}'.format('run mode', 'event (us)')
+        for (name, blocking) in [('start/join', False), ('run_blocking', True)]:
+            cost = benchmark_run_mode(cliparams['numEvents'], blocking)
+            print '{0:>15} {1:>15.2f}'.format(name, cost)
+
+if __name__ == '__main__':
+    main()
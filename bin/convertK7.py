@@ -0,0 +1,73 @@
+#!/usr/bin/python
+"""
+\brief Converts a K7 connectivity trace into the binary format of ConnectivityK7.
+
+The binary trace is memory-mapped by the simulator, which then seeks to any ASN
+without decompressing and parsing the text trace. The ASNs depend on the slot
+duration, which must be the tsch_slotDuration of the simulations replaying the
+binary trace.
+"""
+
+# =========================== adjust path =====================================
+
+import os
+import sys
+
+if __name__ == '__main__':
+    here = sys.path[0]
+    sys.path.insert(0, os.path.join(here, '..'))
+
+# =========================== imports =========================================
+
+import argparse
+
+from SimEngine import Connectivity
+
+# =========================== helpers =========================================
+
+def parseCliParams():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        'trace',
+        help       = 'K7 trace to convert (.k7.gz).',
+    )
+    parser.add_argument(
+        '--output',
+        dest       = 'output',
+        action     = 'store',
+        default    = None,
+        help       = 'Binary trace to write; the trace with a {0} extension by default.'.format(
+            Connectivity.K7_BINARY_EXTENSION
+        ),
+    )
+    parser.add_argument(
+        '--slotDuration',
+        dest       = 'slotDuration',
+        type       = float,
+        default    = 0.010,
+        help       = 'Slot duration of the simulations, in seconds.',
+    )
+    cliparams      = parser.parse_args()
+    return cliparams.__dict__
+
+# =========================== main ============================================
+
+def main():
+
+    cliparams = parseCliParams()
+
+    output = cliparams['output']
+    if output is None:
+        output = cliparams['trace']
+        for extension in ['.gz', '.k7']:
+            if output.endswith(extension):
+                output = output[:-len(extension)]
+        output += Connectivity.K7_BINARY_EXTENSION
+
+    Connectivity.convert_k7_to_binary(cliparams['trace'], output, cliparams['slotDuration'])
+    print 'wrote {0}'.format(output)
+
+if __name__ == '__main__':
+    main()
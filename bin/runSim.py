@@ -24,15 +24,38 @@ import threading
 import math
 import multiprocessing
 import argparse
+import functools
 import json
 import glob
 import shutil
+import traceback
 
 from SimEngine import SimConfig,   \
                       SimEngine,   \
                       SimLog, \
-                      SimSettings, \
-                      Connectivity
+                      SimSettings
+
+# =========================== defines =========================================
+
+# fields of the progress record of each CPU
+PROGRESS_FIELDS = [
+    'simParamNum',
+    'numSimParams',
+    'runNum',
+    'numRuns',
+    'ended',
+    'duration',
+    'asn',
+    'asnEnd',
+    'slotsPerSecond',
+    'eventsPerSecond',
+    'queueDepth',
+    'eta',
+    'updated',
+]
+
+# progress records of all the CPUs, in memory shared among the processes
+progress_record = None
 
 # =========================== helpers =========================================
 
@@ -50,16 +73,82 @@ def parseCliParams():
     cliparams      = parser.parse_args()
     return cliparams.__dict__
 
-def printOrLog(cpuID, output, verbose):
+def printOrLog(cpuID, output, verbose, progress):
     assert cpuID is not None
-    hostname = platform.uname()[1]
 
     if not verbose:
-        with open('{0}-cpu{1}.templog'.format(hostname, cpuID), 'w') as f:
-            f.write(output)
+        setProgress(cpuID, progress)
     else:
         print output
 
+def initProgressRecord(record):
+    global progress_record
+    progress_record = record
+
+def setProgress(cpuID, progress):
+    """
+    Update the progress record of a CPU with the fields in 'progress'; also
+    used as the progress_cb of the engine.
+    """
+    if progress_record is None:
+        return
+    offset = cpuID * len(PROGRESS_FIELDS)
+    for (k, v) in progress.items():
+        progress_record[offset + PROGRESS_FIELDS.index(k)] = -1 if v is None else v
+    progress_record[offset + PROGRESS_FIELDS.index('updated')] = time.time()
+
+def getProgress(cpuID):
+    offset = cpuID * len(PROGRESS_FIELDS)
+    return dict(
+        (k, progress_record[offset + i]) for (i, k) in enumerate(PROGRESS_FIELDS)
+    )
+
+def formatProgress(progress):
+    if progress['updated'] == 0:
+        return 'no info (yet?)'
+
+    if progress['ended']:
+        return 'simulation ended after {0:.0f}s ({1:.0f} runs).'.format(
+            progress['duration'],
+            progress['numSimParams'] * progress['numRuns'],
+        )
+
+    output  = 'parameters {0:.0f}/{1:.0f}, run {2:.0f}/{3:.0f}'.format(
+        progress['simParamNum'],
+        progress['numSimParams'],
+        progress['runNum'],
+        progress['numRuns'],
+    )
+    if progress['asnEnd'] > 0:
+        output += ', slot {0:.0f}/{1:.0f}, {2:.0f} slots/s, {3:.0f} events/s, {4:.0f} events queued, ETA {5}'.format(
+            progress['asn'],
+            progress['asnEnd'],
+            progress['slotsPerSecond'],
+            progress['eventsPerSecond'],
+            progress['queueDepth'],
+            # an unknown ETA is stored as -1
+            'n/a' if progress['eta'] < 0 else '{0:.0f}s'.format(progress['eta']),
+        )
+    # a stuck simulation does not update its progress anymore
+    output += ' (updated {0:.0f}s ago)'.format(time.time() - progress['updated'])
+    return output
+
+def runProgress(simParamNum, numSimParams, runNum, numRuns):
+    # progress at the start of a run
+    return {
+        'simParamNum':     simParamNum,
+        'numSimParams':    numSimParams,
+        'runNum':          runNum,
+        'numRuns':         numRuns,
+        'ended':           0,
+        'asn':             0,
+        'asnEnd':          -1,
+        'slotsPerSecond':  0,
+        'eventsPerSecond': 0,
+        'queueDepth':      0,
+        'eta':             -1,
+    }
+
 def runSimCombinations(params):
     """
     Runs simulations for all combinations of simulation settings.
@@ -90,62 +179,176 @@ def runSimCombinations(params):
         simParams      += [simParam]
 
     # run a simulation for each set of simParams
+    warmUp = simconfig.execution.get('warmUp')
+    if warmUp and hasattr(os, 'fork'):
+        runSimsWithWarmUp(cpuID, numRuns, first_run, verbose, simconfig, combinationKeys, simParams, warmUp)
+    else:
+        for (simParamNum, simParam) in enumerate(simParams):
+
+            # run the simulation runs
+            for run_id in xrange(first_run, first_run+numRuns):
+
+                # printOrLog
+                output  = 'parameters {0}/{1}, run {2}/{3}'.format(
+                   simParamNum+1,
+                   len(simParams),
+                   run_id+1-first_run,
+                   numRuns
+                )
+                printOrLog(
+                    cpuID,
+                    output,
+                    verbose,
+                    runProgress(simParamNum+1, len(simParams), run_id+1-first_run, numRuns),
+                )
+
+                # create the simulation
+                settings         = SimSettings.SimSettings(cpuID=cpuID, run_id=run_id, **simParam)
+                settings.setLogDirectory(simconfig.get_log_directory_name())
+                settings.setCombinationKeys(combinationKeys)
+                simlog           = SimLog.SimLog(settings)
+                simlog.set_log_filters(simconfig.logging)
+                simengine        = SimEngine.SimEngine(
+                    settings,
+                    simlog,
+                    run_id       = run_id,
+                    verbose      = verbose,
+                    profile      = simconfig.execution.get('profile', False),
+                    progress_cb  = None if verbose else functools.partial(setProgress, cpuID),
+                )
+
+
+                # run the simulation, in this process' thread
+                simengine.run_blocking()
+
+                # destroy the simulation
+                simlog.destroy()
+                simengine.destroy()
+                settings.destroy()
+
+    # printOrLog
+    output  = 'simulation ended after {0:.0f}s ({1} runs).'.format(
+        time.time()-simStartTime,
+        numRuns * len(simParams)
+    )
+    printOrLog(
+        cpuID,
+        output,
+        verbose,
+        {
+            'ended':    1,
+            'duration': time.time()-simStartTime,
+        },
+    )
+
+def runSimsWithWarmUp(cpuID, numRuns, first_run, verbose, simconfig, combinationKeys, simParams, warmUp):
+    """
+    Runs the simulations of all the simParams, sharing the warm-up.
+
+    The simParams which differ only in the values of the warm-up combination
+    keys share their first warmUp['numSlotframes'] slotframes: the warm-up is
+    run once per group, with the values of the first simParam of the group,
+    then each simParam of the group continues from it in a forked process.
+    """
+
+    warmUpKeys      = warmUp['combinationKeys']
+    assert set(warmUpKeys) <= set(combinationKeys)
+
+    # group the simParams by the values of the other combination keys
+    groups          = []
     for (simParamNum, simParam) in enumerate(simParams):
+        groupKey    = [simParam[k] for k in combinationKeys if k not in warmUpKeys]
+        for (k, members) in groups:
+            if k == groupKey:
+                members += [(simParamNum, simParam)]
+                break
+        else:
+            groups += [(groupKey, [(simParamNum, simParam)])]
 
-        # run the simulation runs
+    for (_, members) in groups:
         for run_id in xrange(first_run, first_run+numRuns):
 
-            # printOrLog
-            output  = 'parameters {0}/{1}, run {2}/{3}'.format(
-               simParamNum+1,
-               len(simParams),
-               run_id+1-first_run,
-               numRuns
-            )
-            printOrLog(cpuID, output, verbose)
-
-            # create singletons
-            settings         = SimSettings.SimSettings(cpuID=cpuID, run_id=run_id, **simParam)
-            settings.setLogDirectory(simconfig.get_log_directory_name())
+            # create the simulation, with the parameters of the first member;
+            # the warm-up is logged apart
+            settings         = SimSettings.SimSettings(cpuID=cpuID, run_id=run_id, **members[0][1])
+            settings.setLogDirectory('{0}-warmup'.format(simconfig.get_log_directory_name()))
             settings.setCombinationKeys(combinationKeys)
-            simlog           = SimLog.SimLog()
+            assert warmUp['numSlotframes'] < settings.exec_numSlotframesPerRun
+            simlog           = SimLog.SimLog(settings)
             simlog.set_log_filters(simconfig.logging)
-            simengine        = SimEngine.SimEngine(run_id=run_id, verbose=verbose)
+            simengine        = SimEngine.SimEngine(
+                settings,
+                simlog,
+                run_id       = run_id,
+                verbose      = verbose,
+                profile      = simconfig.execution.get('profile', False),
+                progress_cb  = None if verbose else functools.partial(setProgress, cpuID),
+            )
 
+            # run the warm-up
+            simengine.run_until(warmUp['numSlotframes'] * settings.tsch_slotframeLength)
 
-            # start simulation run
-            simengine.start()
+            # nothing buffered may be written twice by the forked processes
+            simlog.flush()
+            sys.stdout.flush()
 
-            # wait for simulation run to end
-            simengine.join()
+            # continue the simulation of each member in a forked process
+            for (simParamNum, simParam) in members:
+
+                # printOrLog
+                output  = 'parameters {0}/{1}, run {2}/{3} (after warm-up)'.format(
+                   simParamNum+1,
+                   len(simParams),
+                   run_id+1-first_run,
+                   numRuns
+                )
+                printOrLog(
+                    cpuID,
+                    output,
+                    verbose,
+                    runProgress(simParamNum+1, len(simParams), run_id+1-first_run, numRuns),
+                )
 
-            # destroy singletons
+                pid = os.fork()
+                if pid == 0:
+                    # child
+                    rc = 0
+                    try:
+                        for k in warmUpKeys:
+                            setattr(settings, k, simParam[k])
+                        settings.setLogDirectory(simconfig.get_log_directory_name())
+                        simlog.switch_output_file()
+                        simengine.run_blocking()
+                        simlog.destroy()
+                    except:
+                        traceback.print_exc()
+                        rc = 1
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    os._exit(rc)
+
+                # parent
+                (_, status) = os.waitpid(pid, 0)
+                if status != 0:
+                    raise Exception('simulation {0} run {1} failed'.format(simParam, run_id))
+
+            # destroy the simulation, remove the warm-up log
+            warmUpFile       = simlog.log_output_file.name
             simlog.destroy()
             simengine.destroy()
-            Connectivity.Connectivity().destroy()
-            settings.destroy() # destroy last, Connectivity needs it
-
-        # printOrLog
-        output  = 'simulation ended after {0:.0f}s ({1} runs).'.format(
-            time.time()-simStartTime,
-            numRuns * len(simParams)
-        )
-        printOrLog(cpuID, output, verbose)
+            settings.destroy()
+            os.remove(warmUpFile)
 
 keep_printing_progress = True
-def printProgressPerCpu(hostname, cpuIDs, clear_console=True):
+def printProgressPerCpu(cpuIDs, clear_console=True):
     while keep_printing_progress:
         time.sleep(1)
         output     = []
+        allDone    = True
         for cpuID in cpuIDs:
-            try:
-                with open('{0}-cpu{1}.templog'.format(hostname, cpuID), 'r') as f:
-                    output += ['[cpu {0}] {1}'.format(cpuID, f.read())]
-            except IOError:
-                output += ['[cpu {0}] no info (yet?)'.format(cpuID)]
-        allDone = True
-        for line in output:
-            if line.count('ended') == 0:
+            progress = getProgress(cpuID)
+            output  += ['[cpu {0}] {1}'.format(cpuID, formatProgress(progress))]
+            if not progress['ended']:
                 allDone = False
         output = '\n'.join(output)
         if clear_console:
@@ -180,6 +383,22 @@ def merge_output_files(folder_path):
                     config = json.loads(inputfile.readline())
                     outputfile.write(json.dumps(config) + "\n")
                     outputfile.write(inputfile.read())
+
+        # concatenate the profiles, if any
+        profile_path_list = sorted(
+            glob.glob(
+                os.path.join(
+                    folder_path,
+                    subfolder.replace('[', '[[]'),
+                    'profile_cpu*.txt'
+                )
+            )
+        )
+        if profile_path_list:
+            with open(os.path.join(folder_path, subfolder + ".profile.txt"), 'w') as outputfile:
+                for file_path in profile_path_list:
+                    with open(file_path, 'r') as inputfile:
+                        outputfile.write(inputfile.read())
         shutil.rmtree(os.path.join(folder_path, subfolder))
 
 # =========================== main ============================================
@@ -246,9 +465,10 @@ def main():
             clear_console = False
         else:
             clear_console = True
+        initProgressRecord(multiprocessing.Array('d', numCPUs * len(PROGRESS_FIELDS), lock=False))
         print_progress_thread = threading.Thread(
             target = printProgressPerCpu,
-            args   = (platform.uname()[1], cpuIDs, clear_console)
+            args   = (cpuIDs, clear_console)
         )
 
         print_progress_thread.start()
@@ -258,7 +478,11 @@ def main():
             time.sleep(0.5)
 
         # start simulations
-        pool = multiprocessing.Pool(numCPUs)
+        pool = multiprocessing.Pool(
+            numCPUs,
+            initializer = initProgressRecord,
+            initargs    = (progress_record,),
+        )
         async_result = pool.map_async(
             runSimCombinations,
             [
@@ -284,10 +508,11 @@ def main():
                 keep_printing_progress = False
                 print_progress_thread.join()
 
-        # cleanup
-        hostname = platform.uname()[1]
-        for i in range(numCPUs):
-            os.remove('{0}-cpu{1}.templog'.format(hostname, i))
+    # remove the warm-up logs
+    shutil.rmtree(
+        os.path.join('simData', '{0}-warmup'.format(simconfig.get_log_directory_name())),
+        ignore_errors = True,
+    )
 
     # merge output files
     folder_path = os.path.join('simData', simconfig.get_log_directory_name())